@@ -0,0 +1,164 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from inventory_api.caching import TTLCache
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Per invoice key of the offline batch, stored apart from the header keys
+BATCH_KEY_FIELD = "idempotency_key"
+
+KEY_REUSED = "La llave de idempotencia ya fue usada en una solicitud diferente"
+
+# Completed keys of this worker, so most retries are answered without a query
+completed_requests = TTLCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def payload_fingerprint(*payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def request_fingerprint(request):
+    data = request.data.dict() if hasattr(request.data, "dict") else request.data
+    return payload_fingerprint(request.method, request.get_full_path(), request.user.id, data)
+
+
+def _find(company_id, key):
+    entry = IdempotencyKey.objects.filter(company_id=company_id, key=key).first()
+    # Rows without a response are claims left in progress before responses were stored with the view's writes
+    if entry is not None and (entry.status_code is None or entry.created_at < timezone.now() - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL)):
+        entry.delete()
+        return None
+    return entry
+
+
+def store_response(request, response):
+    """
+    Stores the successful response of an idempotent request. Call it inside the
+    transaction of the view's writes, right before returning, so both commit or
+    roll back together. When a request with the same key committed first the
+    insert raises IntegrityError and the duplicate is rolled back.
+    """
+    claim = getattr(request, "idempotency", None)
+    if claim is None or not status.is_success(response.status_code):
+        return
+
+    company_id, key, fingerprint = claim
+    IdempotencyKey.objects.create(company_id=company_id, key=key, fingerprint=fingerprint,
+                                  status_code=response.status_code, response=response.data)
+
+
+def _stored(company_id, key):
+    stored = completed_requests.get((company_id, key))
+    if stored is None:
+        entry = _find(company_id, key)
+        if entry is not None:
+            stored = (entry.fingerprint, entry.status_code, entry.response)
+            completed_requests.set((company_id, key), stored)
+    return stored
+
+
+def _replay(fingerprint, stored):
+    stored_fingerprint, status_code, data = stored
+    if stored_fingerprint != fingerprint:
+        return Response({"error": KEY_REUSED}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    response = Response(data, status=status_code)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(view_method):
+    """
+    Lets a create view be retried safely. The first successful response to a
+    request with an Idempotency-Key header is stored with a fingerprint of the
+    request and returned again to every retry with the same key, without
+    running the view. The view must call store_response in its transaction;
+    nothing is stored for a failed or interrupted request, so the client can
+    retry it. A retry running alongside the first request is rolled back when
+    the first one commits, and gets its response.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > 255:
+            return Response({"error": "La llave de idempotencia no puede tener más de 255 caracteres"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+        fingerprint = request_fingerprint(request)
+
+        stored = _stored(company_id, key)
+        if stored is not None:
+            return _replay(fingerprint, stored)
+
+        request.idempotency = (company_id, key, fingerprint)
+        response = view_method(self, request, *args, **kwargs)
+
+        if status.is_success(response.status_code):
+            completed_requests.set((company_id, key), (fingerprint, response.status_code, response.data))
+            return response
+
+        # Failed because a concurrent request with the same key committed first
+        stored = _stored(company_id, key)
+        if stored is not None:
+            return _replay(fingerprint, stored)
+
+        return response
+
+    return wrapper
+
+
+def batch_claim(request, invoice):
+    """
+    (stored key, fingerprint) of an invoice of the offline batch sent with an
+    idempotency_key, None when it has none. Raises for an invalid key.
+    """
+    key = invoice.get(BATCH_KEY_FIELD)
+    if key is None:
+        return None
+
+    if not isinstance(key, str) or not key or len(key) > 255 - len("batch:"):
+        raise Exception("La llave de idempotencia debe ser un texto de máximo 249 caracteres")
+    return f"batch:{key}", payload_fingerprint("batch", request.user.id, invoice)
+
+
+def batch_replay(company_id, claim):
+    """
+    Result stored for an invoice of the batch committed before with the same
+    key, an error when the key was used for a different invoice, or None.
+    """
+    stored = _stored(company_id, claim[0])
+    if stored is None:
+        return None
+
+    stored_fingerprint, _, data = stored
+    if stored_fingerprint != claim[1]:
+        return {"error": KEY_REUSED}
+    return {**data, "replayed": True}
+
+
+def store_batch_results(company_id, claims_and_results):
+    """
+    Stores the results of the invoices of the batch sent with a key. Call it in
+    the transaction that commits them; when a concurrent batch committed one
+    of the keys first the insert raises IntegrityError and the chunk rolls back.
+    """
+    IdempotencyKey.objects.bulk_create([
+        IdempotencyKey(company_id=company_id, key=key, fingerprint=claim_fingerprint,
+                       status_code=status.HTTP_201_CREATED, response=result)
+        for (key, claim_fingerprint), result in claims_and_results
+    ])
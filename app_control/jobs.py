@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import InventoryMovement, InventoryMovementItem, MovementJob
+from .stock import apply_movement_items
+
+# (state of the items processed, new item and movement state, stock mode) per job action
+JOB_ACTIONS = {
+    "approve": ("pending", "approved", "approval"),
+    "override": ("approved", "overrided", "override"),
+}
+
+ACTIVE_JOB_STATES = ("queued", "running")
+
+MOVEMENT_IN_PROGRESS = "El movimiento de inventario se está procesando, intente cuando termine"
+
+JOB_STOPPED = "El proceso se detuvo antes de terminar, los productos pendientes no se procesaron"
+
+executor = ThreadPoolExecutor(max_workers=settings.MOVEMENT_JOB_WORKERS, thread_name_prefix="movement-job")
+
+
+def stale_jobs():
+    """
+    Queued or running jobs not refreshed in MOVEMENT_JOB_STALE_SECONDS, left by
+    a worker process that stopped. Workers refresh updated_at on every chunk.
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.MOVEMENT_JOB_STALE_SECONDS)
+    return MovementJob.objects.filter(status__in=ACTIVE_JOB_STATES, updated_at__lt=stale_before)
+
+
+def has_active_job(movement_id):
+    """
+    Whether a live job is processing the movement. Its stale jobs are marked
+    failed first, so the movement can be changed and they are not resumed after.
+    """
+    now = timezone.now()
+    stale_jobs().filter(inventory_movement_id=movement_id).update(
+        status="failed", error=JOB_STOPPED, finished_at=now, updated_at=now)
+    return MovementJob.objects.filter(inventory_movement_id=movement_id, status__in=ACTIVE_JOB_STATES).exists()
+
+
+def queue_movement_job(movement, action, user):
+    """
+    Creates a job for the movement and submits it to this process' worker pool
+    once the transaction commits, so the request returns right away. Must run
+    inside a transaction, with the movement row locked.
+    """
+    items_state = JOB_ACTIONS[action][0]
+    job = MovementJob.objects.create(
+        inventory_movement=movement, action=action, created_by=user, company_id=movement.company_id,
+        total_items=InventoryMovementItem.objects.filter(inventory_movement=movement, state=items_state).count()
+    )
+    transaction.on_commit(lambda: executor.submit(run_movement_job, job.id))
+    return job
+
+
+def process_chunk(job):
+    """
+    Applies the next MOVEMENT_JOB_CHUNK_SIZE items of the job in one transaction.
+    Once no item is left the movement takes its new state. Returns the number of
+    items processed.
+    """
+    items_state, new_state, mode = JOB_ACTIONS[job.action]
+
+    with transaction.atomic():
+        movement = InventoryMovement.objects.select_for_update().get(pk=job.inventory_movement_id)
+        if movement.state != items_state:
+            raise Exception("El movimiento de inventario cambió de estado mientras se procesaba")
+
+        items = list(InventoryMovementItem.objects.filter(inventory_movement=movement, state=items_state)
+                     .order_by("pk").values_list("id", "inventory_id", "quantity")[:settings.MOVEMENT_JOB_CHUNK_SIZE])
+
+        if not items:
+            movement.state = new_state
+            movement.save()
+            return 0
+
+        apply_movement_items(movement, [(inventory_id, quantity) for _, inventory_id, quantity in items], mode)
+
+        now = timezone.now()
+        InventoryMovementItem.objects.filter(pk__in=[item_id for item_id, _, _ in items]).update(
+            state=new_state, updated_at=now)
+        MovementJob.objects.filter(pk=job.pk).update(processed_items=F("processed_items") + len(items), updated_at=now)
+
+    return len(items)
+
+
+def run_movement_job(job_id, resume=False):
+    """
+    Processes a queued job (or, with resume=True, a stale one) chunk by chunk.
+    The job is claimed with one conditional UPDATE, so only one worker runs it.
+    An error stops it and is stored on the job; the chunks already committed
+    stay applied, like items approved one by one, and a new job continues with
+    the rest.
+    """
+    try:
+        jobs = stale_jobs() if resume else MovementJob.objects.filter(status="queued")
+        if not jobs.filter(pk=job_id).update(status="running", updated_at=timezone.now()):
+            return
+
+        job = MovementJob.objects.get(pk=job_id)
+        while process_chunk(job):
+            pass
+
+        now = timezone.now()
+        MovementJob.objects.filter(pk=job_id, status="running").update(status="done", finished_at=now, updated_at=now)
+    except Exception as e:
+        now = timezone.now()
+        MovementJob.objects.filter(pk=job_id, status="running").update(
+            status="failed", error=str(e), finished_at=now, updated_at=now)
+    finally:
+        # Pool threads are not request threads, Django won't close their connection
+        connection.close()
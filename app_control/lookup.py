@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import transaction
+
+from inventory_api.caching import TTLCache
+from .models import Inventory
+
+PRODUCT_FIELDS = ("id", "code", "name", "selling_price", "usd_price", "total_in_shops", "total_in_storage",
+                  "group_id", "active", "catalog_version")
+
+# Products by (company id, product id) and product ids by (company id, code) of
+# this worker. Writes made by this worker drop their products on commit, changes
+# made by other workers show up after the TTL.
+product_cache = TTLCache(maxsize=settings.PRODUCT_LOOKUP_CACHE_SIZE, ttl=settings.PRODUCT_LOOKUP_CACHE_TTL)
+product_ids = TTLCache(maxsize=settings.PRODUCT_LOOKUP_CACHE_SIZE, ttl=settings.PRODUCT_LOOKUP_CACHE_TTL)
+
+
+def lookup_products(company_id, codes):
+    """
+    Returns the products of the company with the given codes, keyed by code.
+    Codes that aren't cached are resolved with one query on the unique_code index.
+    """
+    products = {}
+    for code in codes:
+        inventory_id = product_ids.get((company_id, code))
+        product = product_cache.get((company_id, inventory_id)) if inventory_id is not None else None
+        # The code may have moved to another product since it was cached
+        if product is not None and product["code"] == code:
+            products[code] = product
+
+    missing = [code for code in codes if code not in products]
+    if missing:
+        for product in Inventory.objects.filter(company_id=company_id, code__in=missing).values(*PRODUCT_FIELDS):
+            product_cache.set((company_id, product["id"]), product)
+            product_ids.set((company_id, product["code"]), product["id"])
+            products[product["code"]] = product
+
+    return products
+
+
+def invalidate_products(company_id, inventory_ids=None):
+    """
+    Drops the cached products of the company, or only the given ones, once the
+    current transaction commits.
+    """
+    inventory_ids = set(inventory_ids) if inventory_ids is not None else None
+
+    def invalidate():
+        if inventory_ids is None:
+            product_cache.delete_many(lambda key, product: key[0] == company_id)
+            return
+
+        for inventory_id in inventory_ids:
+            product_cache.delete((company_id, inventory_id))
+
+    transaction.on_commit(invalidate)
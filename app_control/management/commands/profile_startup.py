@@ -0,0 +1,176 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is imported yet. Prints the phase timings
+# as JSON on the last stdout line; -X importtime writes the per module data to stderr.
+PROBE = """
+import json, os, time
+timings = {}
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "inventory_api.settings")
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+timings["settings"] = time.perf_counter() - start
+
+mark = time.perf_counter()
+django.setup(set_prefix=False)
+timings["django_setup"] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+import inventory_api.wsgi
+timings["wsgi_application"] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+timings["urlconf"] = time.perf_counter() - mark
+
+if {network}:
+    from user_control.cognito_utils import key_store
+    mark = time.perf_counter()
+    try:
+        key_store.refresh()
+    except Exception as e:
+        timings["cognito_jwks_error"] = str(e)
+    timings["cognito_jwks_fetch"] = time.perf_counter() - mark
+
+timings["total"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+# Packages reported individually; everything else is grouped under its top level name
+TRACKED_MODULES = (
+    "user_control.cognito_utils", "inventory_api.aws", "boto3", "botocore", "openpyxl", "numpy", "jose",
+    "cryptography", "requests", "psycopg2", "rest_framework", "django", "app_control.views",
+    "app_control.reports", "app_control.stats", "inventory_api.utils",
+)
+
+
+class Command(BaseCommand):
+    help = "Measures the cold start of a worker (imports, django setup, urlconf) and writes a JSON report"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters to sample")
+        parser.add_argument("--output", help="Path of the JSON report, printed to stdout when omitted")
+        parser.add_argument("--compare", help="Previous JSON report to compare against")
+        parser.add_argument("--network", action="store_true",
+                            help="Also time the first Cognito JWKS fetch done by the key store")
+        parser.add_argument("--top", type=int, default=25, help="Slowest modules kept in the report")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat debe ser mayor a 0")
+
+        samples = [self.run_probe(options["network"]) for _ in range(options["repeat"])]
+
+        report = {
+            "created_at": datetime.now().isoformat(),
+            "commit": self.current_commit(),
+            "python": platform.python_version(),
+            "settings": os.environ.get("DJANGO_SETTINGS_MODULE"),
+            "repeat": options["repeat"],
+            "phases_ms": self.median_of(sample["phases"] for sample in samples),
+            "tracked_modules_ms": self.median_of(sample["tracked"] for sample in samples),
+            "packages_ms": self.median_of(sample["packages"] for sample in samples),
+            "slowest_modules_ms": dict(
+                sorted(self.median_of(sample["modules"] for sample in samples).items(),
+                       key=lambda item: item[1], reverse=True)[:options["top"]]
+            ),
+        }
+
+        errors = [sample["phases_error"] for sample in samples if sample.get("phases_error")]
+        if errors:
+            report["errors"] = sorted(set(errors))
+
+        content = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(content)
+            self.stdout.write(f"Reporte guardado en {options['output']}")
+        else:
+            self.stdout.write(content)
+
+        if options["compare"]:
+            self.print_comparison(report, options["compare"])
+
+    def run_probe(self, network):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.replace("{network}", str(network))],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True
+        )
+
+        if result.returncode != 0:
+            raise CommandError(f"El proceso de medición falló:\n{result.stderr[-2000:]}")
+
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        phases_error = timings.pop("cognito_jwks_error", None)
+
+        modules, packages, tracked = self.parse_importtime(result.stderr)
+
+        return {
+            "phases": {name: round(seconds * 1000, 2) for name, seconds in timings.items()},
+            "phases_error": phases_error,
+            "modules": modules,
+            "packages": packages,
+            "tracked": tracked,
+        }
+
+    @staticmethod
+    def parse_importtime(stderr):
+        modules, packages, tracked = {}, {}, {}
+
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+
+            self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+            self_ms = int(self_us) / 1000
+            cumulative_ms = int(cumulative_us) / 1000
+
+            modules[name] = cumulative_ms
+            top_level = name.split(".")[0]
+            packages[top_level] = round(packages.get(top_level, 0) + self_ms, 3)
+
+            if name in TRACKED_MODULES:
+                tracked[name] = cumulative_ms
+
+        return modules, packages, tracked
+
+    @staticmethod
+    def median_of(dicts):
+        values = {}
+        for data in dicts:
+            for key, value in data.items():
+                values.setdefault(key, []).append(value)
+        return {key: round(statistics.median(items), 2) for key, items in values.items()}
+
+    @staticmethod
+    def current_commit():
+        try:
+            return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                  capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            return None
+
+    def print_comparison(self, report, path):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)
+
+        self.stdout.write(f"\nComparación contra {previous.get('commit')} ({path})")
+        for section in ("phases_ms", "tracked_modules_ms"):
+            self.stdout.write(f"\n{section}")
+            current_values = report.get(section, {})
+            previous_values = previous.get(section, {})
+            for name in sorted(set(current_values) | set(previous_values)):
+                before = previous_values.get(name, 0)
+                after = current_values.get(name, 0)
+                self.stdout.write(f"  {name:<32} {before:>10.2f} -> {after:>10.2f} ms ({after - before:+.2f})")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_control.models import Invoice
+from app_control.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the sales rollups read by the stats endpoints from the invoices"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, help="Only rebuild the rollups of this company id")
+
+    def handle(self, *args, **options):
+        company_ids = [options["company"]] if options["company"] else \
+            Invoice.objects.exclude(company_id=None).order_by().values_list("company_id", flat=True).distinct()
+
+        for company_id in company_ids:
+            with transaction.atomic():
+                count = rebuild_rollups(company_id)
+            self.stdout.write(f"Company {company_id}: {count} rollup rows")
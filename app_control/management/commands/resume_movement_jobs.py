@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from app_control.jobs import run_movement_job, stale_jobs
+from app_control.models import MovementJob
+
+
+class Command(BaseCommand):
+    help = "Runs the movement jobs left queued or running by a stopped worker process (run it from cron)"
+
+    def handle(self, *args, **options):
+        job_ids = list(stale_jobs().order_by("created_at").values_list("id", flat=True))
+
+        for job_id in job_ids:
+            run_movement_job(job_id, resume=True)
+            job = MovementJob.objects.get(pk=job_id)
+            self.stdout.write(f"Job {job_id}: {job.status}, {job.processed_items}/{job.total_items} items")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_control.models import Inventory
+from app_control.stock import take_stock_snapshot
+
+
+class Command(BaseCommand):
+    help = "Stores a stock snapshot of every product, meant to run periodically (e.g. nightly from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, help="Only snapshot the products of this company id")
+
+    def handle(self, *args, **options):
+        company_ids = [options["company"]] if options["company"] else \
+            Inventory.objects.order_by().values_list("company_id", flat=True).distinct()
+
+        for company_id in company_ids:
+            with transaction.atomic():
+                taken_at, count = take_stock_snapshot(company_id)
+            self.stdout.write(f"Company {company_id}: {count} products at {taken_at.isoformat()}")
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:23
+
+from django.db import migrations, models
+
+
+def mark_voided_invoice_items(apps, schema_editor):
+    InvoiceItem = apps.get_model("app_control", "InvoiceItem")
+    InvoiceItem.objects.filter(invoice__is_override=True).update(is_override=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_control', '0020_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='is_override',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_voided_invoice_items, migrations.RunPython.noop),
+    ]
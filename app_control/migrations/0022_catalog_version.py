@@ -0,0 +1,59 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_control', '0012_alter_customuser_sub'),
+        ('app_control', '0021_invoiceitem_is_override'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inventory_id', models.BigIntegerField()),
+                ('code', models.CharField(max_length=10, null=True)),
+                ('catalog_version', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VersionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='catalog_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['company', 'catalog_version'], name='inventory_catalog_version'),
+        ),
+        migrations.AddField(
+            model_name='versioncounter',
+            name='company',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='version_counter_company', to='user_control.company'),
+        ),
+        migrations.AddField(
+            model_name='catalogtombstone',
+            name='company',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='catalog_tombstone_company', to='user_control.company'),
+        ),
+        migrations.AddConstraint(
+            model_name='versioncounter',
+            constraint=models.UniqueConstraint(fields=('company', 'scope'), name='unique_version_scope'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogtombstone',
+            index=models.Index(fields=['company', 'catalog_version'], name='tombstone_catalog_version'),
+        ),
+    ]
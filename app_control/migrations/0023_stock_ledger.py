@@ -0,0 +1,65 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def snapshot_current_stock(apps, schema_editor):
+    Inventory = apps.get_model("app_control", "Inventory")
+    StockSnapshot = apps.get_model("app_control", "StockSnapshot")
+    taken_at = timezone.now()
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(inventory_id=inventory_id, total_in_shops=shops, total_in_storage=storage,
+                      taken_at=taken_at, company_id=company_id)
+        for inventory_id, shops, storage, company_id in Inventory.objects.values_list(
+            "id", "total_in_shops", "total_in_storage", "company_id").iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_control', '0012_alter_customuser_sub'),
+        ('app_control', '0022_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_in_shops', models.IntegerField()),
+                ('total_in_storage', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_snapshot_company', to='user_control.company')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='app_control.inventory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(choices=[('store', 'store'), ('warehouse', 'warehouse')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('source', models.CharField(choices=[('invoice', 'invoice'), ('void', 'void'), ('movement', 'movement'), ('override', 'override'), ('adjustment', 'adjustment')], max_length=20)),
+                ('reference_id', models.BigIntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_ledger_company', to='user_control.company')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_ledger', to='app_control.inventory')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['company', 'taken_at'], name='stock_snapshot_company_date'),
+        ),
+        migrations.AddIndex(
+            model_name='stockledgerentry',
+            index=models.Index(fields=['company', 'created_at'], name='stock_ledger_company_date'),
+        ),
+        migrations.AddIndex(
+            model_name='stockledgerentry',
+            index=models.Index(fields=['inventory', 'created_at'], name='stock_ledger_inventory_date'),
+        ),
+        migrations.RunPython(snapshot_current_stock, migrations.RunPython.noop),
+    ]
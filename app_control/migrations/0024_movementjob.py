@@ -0,0 +1,37 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('user_control', '0012_alter_customuser_sub'),
+        ('app_control', '0023_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('approve', 'approve'), ('override', 'override')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='queued', max_length=20)),
+                ('total_items', models.PositiveIntegerField(default=0)),
+                ('processed_items', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='movement_job_company', to='user_control.company')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movement_jobs', to=settings.AUTH_USER_MODEL)),
+                ('inventory_movement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='app_control.inventorymovement')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
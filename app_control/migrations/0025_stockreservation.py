@@ -0,0 +1,50 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def reserve_pending_movements(apps, schema_editor):
+    InventoryMovementItem = apps.get_model("app_control", "InventoryMovementItem")
+    StockReservation = apps.get_model("app_control", "StockReservation")
+
+    # Shipments and returns take their units from the origin, purchases have none
+    pending = InventoryMovementItem.objects.filter(
+        state="pending", inventory_movement__state="pending",
+        inventory_movement__event_type__in=("shipment", "return"), inventory_movement__origin__isnull=False
+    ).values("inventory_id", "inventory_movement__origin", "inventory__company_id").annotate(
+        reserved=Sum("quantity")).order_by()
+
+    StockReservation.objects.bulk_create([
+        StockReservation(inventory_id=row["inventory_id"], location=row["inventory_movement__origin"],
+                         reserved=row["reserved"], company_id=row["inventory__company_id"])
+        for row in pending
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_control', '0012_alter_customuser_sub'),
+        ('app_control', '0024_movementjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(choices=[('store', 'store'), ('warehouse', 'warehouse')], max_length=20)),
+                ('reserved', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_reservation_company', to='user_control.company')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='app_control.inventory')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(fields=('inventory', 'location'), name='unique_reservation'),
+        ),
+        migrations.RunPython(reserve_pending_movements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_control', '0012_alter_customuser_sub'),
+        ('app_control', '0025_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('seller_id', models.BigIntegerField(default=0)),
+                ('item_id', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('usd_amount', models.FloatField(default=0)),
+                ('dollar_usd_amount', models.FloatField(default=0)),
+                ('gift_quantity', models.BigIntegerField(default=0)),
+                ('gift_amount', models.FloatField(default=0)),
+                ('voided_quantity', models.BigIntegerField(default=0)),
+                ('voided_amount', models.FloatField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='sales_rollup_company', to='user_control.company')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(fields=('company', 'date', 'hour', 'seller_id', 'item_id'), name='unique_sales_rollup'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_control', '0026_salesrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockledgerentry',
+            name='inventory',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_ledger', to='app_control.inventory'),
+        ),
+        migrations.AlterField(
+            model_name='stocksnapshot',
+            name='inventory',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_snapshots', to='app_control.inventory'),
+        ),
+    ]
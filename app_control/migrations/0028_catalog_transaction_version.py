@@ -0,0 +1,20 @@
+# Generated by Django 4.1.3 on 2026-10-18 05:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_control', '0027_keep_stock_history'),
+    ]
+
+    # Catalog versions become transaction ids: stamp every product and tombstone
+    # with this one, so terminals holding an older counter version resync them
+    operations = [
+        migrations.RunSQL(
+            "UPDATE app_control_inventory SET catalog_version = txid_current();"
+            "UPDATE app_control_catalogtombstone SET catalog_version = txid_current();",
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.3 on 2026-10-18 05:30
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+MEASURES = ("quantity", "amount", "usd_amount", "dollar_usd_amount", "gift_quantity", "gift_amount",
+            "voided_quantity", "voided_amount")
+
+
+def fill_sales_rollups(apps, schema_editor):
+    # Same totals as app_control.rollups.rebuild_rollups, computed with the models of this migration
+    InvoiceItem = apps.get_model("app_control", "InvoiceItem")
+    SalesRollup = apps.get_model("app_control", "SalesRollup")
+
+    totals = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    for (company_id, created_at, seller_id, item_id, quantity, amount, usd_amount, is_gift, is_dollar, is_override,
+         invoice_is_override) in InvoiceItem.objects.exclude(invoice__company_id=None).values_list(
+            "invoice__company_id", "invoice__created_at", "invoice__sale_by_id", "item_id", "quantity", "amount",
+            "usd_amount", "is_gift", "invoice__is_dollar", "is_override", "invoice__is_override").iterator(
+            chunk_size=2000):
+        local = timezone.localtime(created_at)
+        row = totals[(company_id, local.date(), local.hour, seller_id or 0, item_id or 0)]
+        amount, usd_amount = amount or 0, usd_amount or 0
+
+        if is_override or invoice_is_override:
+            row["voided_quantity"] += quantity
+            row["voided_amount"] += amount
+        elif is_gift:
+            row["gift_quantity"] += quantity
+            row["gift_amount"] += amount
+        else:
+            row["quantity"] += quantity
+            row["amount"] += amount
+            row["usd_amount"] += usd_amount
+            row["dollar_usd_amount"] += usd_amount if is_dollar else 0
+
+    SalesRollup.objects.all().delete()
+    SalesRollup.objects.bulk_create([
+        SalesRollup(company_id=company_id, date=date, hour=hour, seller_id=seller_id, item_id=item_id, **measures)
+        for (company_id, date, hour, seller_id, item_id), measures in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_control', '0028_catalog_transaction_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_sales_rollups, migrations.RunPython.noop),
+    ]
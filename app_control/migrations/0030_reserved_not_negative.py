@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_control', '0029_fill_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.CheckConstraint(check=models.Q(('reserved__gte', 0)), name='reserved_not_negative'),
+        ),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import CheckConstraint, Q, UniqueConstraint
 
 from user_control.models import CustomUser, Company
 from user_control.views import add_user_activity
@@ -11,14 +12,25 @@ PaymentMethods = (("cash", "cash"), ("creditCard", "creditCard"), ("debitCard",
 Document_types = (("CC", "CC"), ("PA", "PA"), ("NIT", "NIT"),
                   ("CE", "CC"), ("TI", "TI"), ("DIE", "DIE"))
 
+CATALOG_SCOPE = "catalog"
+
+SALES_SCOPE = "sales"
+
 InventoryEvents = (("purchase", "purchase"), ("shipment", "shipment"), ("return", "return"))
 
 MovementStates = (("pending", "pending"), ("approved", "approved"),
                   ("rejected", "rejected"), ("overrided", "overrided"))
 
+MovementJobActions = (("approve", "approve"), ("override", "override"))
+
+JobStates = (("queued", "queued"), ("running", "running"), ("done", "done"), ("failed", "failed"))
+
 
 StorageTypes = (("store", "store"), ("warehouse", "warehouse"))
 
+StockSources = (("invoice", "invoice"), ("void", "void"), ("movement", "movement"),
+                ("override", "override"), ("adjustment", "adjustment"))
+
 
 class InventoryGroup(models.Model):
     created_by = models.ForeignKey(
@@ -52,7 +64,10 @@ class InventoryGroup(models.Model):
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            self.inventories.update(group=None, catalog_version=transaction_version())
+            super().delete(*args, **kwargs)
+            VersionCounter.bump_on_commit(self.company_id, CATALOG_SCOPE)
 
     def __str__(self):
         return self.name
@@ -98,6 +113,10 @@ class Provider(models.Model):
         return self.name
 
 
+# Inventory counters, only ever moved by deltas once the row exists
+STOCK_FIELDS = ("total_in_shops", "total_in_storage")
+
+
 class Inventory(models.Model):
     created_by = models.ForeignKey(
         CustomUser, null=True, related_name="inventory_items",
@@ -121,6 +140,7 @@ class Inventory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     active = models.BooleanField(default=True, null=False)
+    catalog_version = models.PositiveBigIntegerField(default=0)
     company = models.ForeignKey(
         Company, null=True, related_name="inventory_company",
         on_delete=models.DO_NOTHING
@@ -131,12 +151,69 @@ class Inventory(models.Model):
         constraints = [
             UniqueConstraint(fields=["code", "company"], name="unique_code")
         ]
+        indexes = [
+            models.Index(fields=["company", "catalog_version"], name="inventory_catalog_version")
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.old_stock = (self.__dict__.get("total_in_shops"), self.__dict__.get("total_in_storage"))
+        # (source, reference id) of the ledger rows written by the next save
+        self.stock_source = ("adjustment", None)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            self.catalog_version = transaction_version()
+            source, reference_id = self.stock_source
+
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                StockLedgerEntry.objects.bulk_create([
+                    StockLedgerEntry(inventory_id=self.id, location=location, quantity=units, source=source,
+                                     reference_id=reference_id, company_id=self.company_id)
+                    for location, units in (("store", self.total_in_shops), ("warehouse", self.total_in_storage))
+                    if units
+                ])
+            else:
+                self.save_existing(source, reference_id, *args, **kwargs)
+            VersionCounter.bump_on_commit(self.company_id, CATALOG_SCOPE)
+        self.old_stock = (self.total_in_shops, self.total_in_storage)
+        self.stock_source = ("adjustment", None)
+
+    def save_existing(self, source, reference_id, *args, **kwargs):
+        """
+        Saves every field but the counters, which may be stale by now. Counters
+        changed on this instance (product edits, CSV loads, older code paths)
+        are applied as deltas with apply_stock_changes and read back.
+        """
+        from .stock import StockChange, apply_stock_changes
+
+        deferred = self.get_deferred_fields()
+        update_fields = kwargs.pop("update_fields", None) or [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        ]
+        super().save(*args, update_fields={"catalog_version", *update_fields} - set(STOCK_FIELDS), **kwargs)
+
+        changes = [
+            StockChange(self.id, location, getattr(self, field) - old, reference_id)
+            for location, field, old in (("store", "total_in_shops", self.old_stock[0]),
+                                         ("warehouse", "total_in_storage", self.old_stock[1]))
+            if old is not None and field in update_fields
+        ]
+        if apply_stock_changes(self.company_id, source, changes):
+            raise Exception(f"item with code {self.code} does not have enough quantity")
+        if any(change.quantity for change in changes):
+            self.total_in_shops, self.total_in_storage = Inventory.objects.values_list(
+                *STOCK_FIELDS).get(pk=self.pk)
 
     def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            CatalogTombstone.objects.create(
+                inventory_id=self.id, code=self.code, company_id=self.company_id,
+                catalog_version=transaction_version())
+            super().delete(*args, **kwargs)
+            VersionCounter.bump_on_commit(self.company_id, CATALOG_SCOPE)
 
     def __str__(self):
         return f"{self.name} - {self.code}"
@@ -308,6 +385,7 @@ class InvoiceItem(models.Model):
     original_amount = models.FloatField(null=True)
     original_usd_amount = models.FloatField(null=True)
     is_gift = models.BooleanField(default=False)
+    is_override = models.BooleanField(default=False)
     company = models.ForeignKey(
         Company, null=True, related_name="invoice_item_company",
         on_delete=models.DO_NOTHING
@@ -326,6 +404,7 @@ class InvoiceItem(models.Model):
         self.original_amount = self.quantity * self.item.selling_price
         self.original_usd_amount = self.quantity * self.item.usd_price
         self.item.total_in_shops = self.item.total_in_shops - self.quantity
+        self.item.stock_source = ("invoice", self.invoice_id)
         self.item.save()
 
         super().save(*args, **kwargs)
@@ -411,3 +490,259 @@ class InventoryMovementItem(models.Model):
 
     class Meta:
         ordering = ("-updated_at",)
+
+
+class SalesRollup(models.Model):
+    """
+    Sales of a product by a seller in one local hour, kept up to date when
+    invoices are created, voided or change currency. seller_id and item_id are 0
+    when the invoice has no seller or the product was deleted.
+    """
+    company = models.ForeignKey(
+        Company, related_name="sales_rollup_company", on_delete=models.DO_NOTHING)
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    seller_id = models.BigIntegerField(default=0)
+    item_id = models.BigIntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    amount = models.FloatField(default=0)
+    usd_amount = models.FloatField(default=0)
+    dollar_usd_amount = models.FloatField(default=0)
+    gift_quantity = models.BigIntegerField(default=0)
+    gift_amount = models.FloatField(default=0)
+    voided_quantity = models.BigIntegerField(default=0)
+    voided_amount = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["company", "date", "hour", "seller_id", "item_id"], name="unique_sales_rollup")
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.hour} - {self.seller_id} - {self.item_id}"
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product promised to the pending items of pending movements that
+    take them from location. Available units are the counter minus reserved.
+    """
+    inventory = models.ForeignKey(
+        Inventory, related_name="reservations", on_delete=models.CASCADE)
+    location = models.CharField(max_length=20, choices=StorageTypes)
+    reserved = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    company = models.ForeignKey(
+        Company, null=True, related_name="stock_reservation_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["inventory", "location"], name="unique_reservation"),
+            CheckConstraint(check=Q(reserved__gte=0), name="reserved_not_negative"),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_id} - {self.location} - {self.reserved}"
+
+
+class MovementJob(models.Model):
+    """
+    Approval or override of a movement processed in the background, a chunk of
+    items per transaction. A failed job leaves the processed items in their new
+    state and the rest as they were, a new job continues with them. updated_at
+    is the worker's heartbeat, see jobs.stale_jobs.
+    """
+    inventory_movement = models.ForeignKey(
+        InventoryMovement, related_name="jobs", on_delete=models.CASCADE)
+    action = models.CharField(max_length=20, choices=MovementJobActions)
+    status = models.CharField(max_length=20, choices=JobStates, default="queued")
+    total_items = models.PositiveIntegerField(default=0)
+    processed_items = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True)
+    created_by = models.ForeignKey(
+        CustomUser, null=True, related_name="movement_jobs",
+        on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True)
+    company = models.ForeignKey(
+        Company, null=True, related_name="movement_job_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.inventory_movement_id} - {self.action} - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a write request sent with an Idempotency-Key header, replayed
+    when a terminal retries the same request.
+    """
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    company = models.ForeignKey(
+        Company, null=True, related_name="idempotency_key_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["key", "company"], name="unique_idempotency_key")
+        ]
+
+    def __str__(self):
+        return f"{self.key} - {self.status_code}"
+
+
+def transaction_version():
+    """
+    Id of the current transaction, stamped as the catalog_version of the products
+    and tombstones it writes. Taking it locks nothing, so concurrent sales don't
+    queue on it; versions are not committed in order, terminals sync against
+    snapshot_version instead.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_current()")
+        return cursor.fetchone()[0]
+
+
+def snapshot_version():
+    """
+    Oldest transaction still running: every version below it is committed (or
+    rolled back) and visible. A long running transaction holds it back, so
+    syncs resend the changes made since it started.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+
+class VersionCounter(models.Model):
+    """
+    Per company counter of a scope (the catalog or the sales) that changes with
+    its data, used to key cached responses. It is bumped after the commit
+    (bump_on_commit) in a statement of its own, so writes never hold the counter
+    row lock and a company's sales don't queue on it. The trade-off: requests
+    between a commit and its bump may still get the previous cached answer, and
+    a process dying in between leaves the cache stale until its TTL.
+    """
+    scope = models.CharField(max_length=50)
+    value = models.PositiveBigIntegerField(default=0)
+    company = models.ForeignKey(
+        Company, null=True, related_name="version_counter_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["company", "scope"], name="unique_version_scope")
+        ]
+
+    @classmethod
+    def bump(cls, company_id, scope):
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET value = value + 1 WHERE company_id = %s AND scope = %s RETURNING value",
+                [company_id, scope]
+            )
+            row = cursor.fetchone()
+        if row:
+            return row[0]
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(company_id=company_id, scope=scope, value=1)
+            return 1
+        except IntegrityError:
+            return cls.bump(company_id, scope)
+
+    @classmethod
+    def bump_on_commit(cls, company_id, scope):
+        transaction.on_commit(lambda: cls.bump(company_id, scope))
+
+    def __str__(self):
+        return f"{self.scope} - {self.value}"
+
+
+class CatalogTombstone(models.Model):
+    """
+    Deleted product, kept so terminals syncing the catalog can drop it.
+    """
+    inventory_id = models.BigIntegerField()
+    code = models.CharField(max_length=10, null=True)
+    catalog_version = models.PositiveBigIntegerField()
+    company = models.ForeignKey(
+        Company, null=True, related_name="catalog_tombstone_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["company", "catalog_version"], name="tombstone_catalog_version")
+        ]
+
+    def __str__(self):
+        return f"{self.code} - {self.catalog_version}"
+
+
+class StockLedgerEntry(models.Model):
+    """
+    Append-only record of every change to a product's store or warehouse units.
+    reference_id is the invoice or the movement that caused it. Entries (and
+    snapshots) outlive their product, so it has no database constraint.
+    """
+    inventory = models.ForeignKey(
+        Inventory, related_name="stock_ledger", on_delete=models.DO_NOTHING, db_constraint=False)
+    location = models.CharField(max_length=20, choices=StorageTypes)
+    quantity = models.IntegerField()
+    source = models.CharField(max_length=20, choices=StockSources)
+    reference_id = models.BigIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    company = models.ForeignKey(
+        Company, null=True, related_name="stock_ledger_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["company", "created_at"], name="stock_ledger_company_date"),
+            models.Index(fields=["inventory", "created_at"], name="stock_ledger_inventory_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_id} - {self.location} - {self.quantity}"
+
+
+class StockSnapshot(models.Model):
+    """
+    Units of a product at taken_at. Snapshots are taken for a whole company at
+    once, stock at a later time is the snapshot plus the ledger after it.
+    """
+    inventory = models.ForeignKey(
+        Inventory, related_name="stock_snapshots", on_delete=models.DO_NOTHING, db_constraint=False)
+    total_in_shops = models.IntegerField()
+    total_in_storage = models.IntegerField()
+    taken_at = models.DateTimeField()
+    company = models.ForeignKey(
+        Company, null=True, related_name="stock_snapshot_company",
+        on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["company", "taken_at"], name="stock_snapshot_company_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_id} - {self.taken_at}"
@@ -0,0 +1,54 @@
+from django.db import connection
+
+from .models import DianResolution
+
+RESOLUTION_EXHAUSTED = "La Resolución de la DIAN no tiene más números disponibles, registre una nueva resolución"
+
+
+def take_invoice_numbers(resolution_id, count):
+    """
+    Takes ``count`` consecutive DIAN numbers with one conditional
+    ``UPDATE ... RETURNING`` that never goes past ``to_number``. Near the end of
+    the range it returns the numbers that were left, so the result can be
+    shorter than ``count``. Run it inside the sale transaction, as the last step
+    before the invoices are inserted: the resolution row stays locked until the
+    commit, and a sale that fails or rolls back gives its numbers back.
+    """
+    last_number = _increment(resolution_id, count)
+    if last_number is not None:
+        return list(range(last_number - count + 1, last_number + 1))
+
+    numbers = []
+    while len(numbers) < count:
+        last_number = _increment(resolution_id, 1)
+        if last_number is None:
+            break
+        numbers.append(last_number)
+    return numbers
+
+
+def lock_resolution(resolution_id):
+    """
+    Locks the resolution row until the commit. A batch takes it before locking
+    its products, the order of a single sale (numbered, then the stock UPDATE).
+    """
+    list(DianResolution.objects.select_for_update().filter(pk=resolution_id).values_list("id", flat=True))
+
+
+def next_invoice_number(resolution_id):
+    numbers = take_invoice_numbers(resolution_id, 1)
+    if not numbers:
+        raise Exception(RESOLUTION_EXHAUSTED)
+    return numbers[0]
+
+
+def _increment(resolution_id, size):
+    table = connection.ops.quote_name(DianResolution._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET current_number = current_number + %s "
+            f"WHERE id = %s AND current_number + %s <= to_number RETURNING current_number",
+            [size, resolution_id, size]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
@@ -11,7 +11,7 @@ from openpyxl.utils import get_column_letter
 from rest_framework.views import APIView
 from sqlparse.sql import Case
 
-from inventory_api.excel_manager import apply_styles_to_cells
+from inventory_api.excel_manager import apply_styles_to_cells, save_workbook
 
 from .serializers import (
     Inventory, Invoice, Customer
@@ -73,7 +73,7 @@ class ReportExporter(APIView):
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
             .filter(is_override=False)
             .filter(is_dollar=True)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .values_list("sale_by__fullname")
             .annotate(
                 quantity=Sum("invoice_items__usd_amount")
@@ -85,7 +85,7 @@ class ReportExporter(APIView):
         cash_report_data = (
             invoices_queryset.select_related("InvoiceItems", "created_by")
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
             .values_list("sale_by__fullname")
             .annotate(
@@ -97,7 +97,7 @@ class ReportExporter(APIView):
             invoices_queryset.select_related("InvoiceItems", "created_by")
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .filter(is_dollar=True)
             .values_list("sale_by__fullname")
             .annotate(
@@ -134,7 +134,7 @@ class ReportExporter(APIView):
 
         apply_styles_to_cells(1, 1, last_column, last_row, ws, alignment=Alignment(horizontal="center"))
 
-        wb.save(response)
+        save_workbook(wb, response)
         add_user_activity(request.user, f"Descargó el reporte diario de ventas desde {request.data.get('start_date')} hasta {request.data.get('end_date')}")
         return response
 
@@ -173,7 +173,7 @@ class InventoriesReportExporter(APIView):
 
         create_inventory_report(ws, inventories_report_data)
 
-        wb.save(response)
+        save_workbook(wb, response)
 
         add_user_activity(request.user, f"Descargó el reporte de inventarios desde {request.data.get('start_date')} hasta {request.data.get('end_date')}")
         return response
@@ -203,7 +203,7 @@ class ItemsReportExporter(APIView):
             invoices_queryset.select_related("InvoiceItems")
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .values_list("invoice_items__item_code", "invoice_items__item_name")
             .annotate(
                 quantity=Sum("invoice_items__quantity"),
@@ -213,8 +213,7 @@ class ItemsReportExporter(APIView):
         report_data_nulled = (
             invoices_queryset.select_related("InvoiceItems")
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
-            .filter(is_override=True)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=True)
             .values_list("invoice_items__item_code", "invoice_items__item_name")
             .annotate(
                 quantity=Sum("invoice_items__quantity"),
@@ -225,7 +224,7 @@ class ItemsReportExporter(APIView):
             filter_company(Invoice.objects.all(), self.request.user.company_id).select_related("InvoiceItems")
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=True)
+            .filter(invoice_items__is_gift=True, invoice_items__is_override=False)
             .values_list("invoice_items__item_code", "invoice_items__item_name")
             .annotate(
                 quantity=Sum("invoice_items__quantity"),
@@ -235,7 +234,7 @@ class ItemsReportExporter(APIView):
         create_product_sales_report(ws, report_data, report_data_nulled, report_data_gifts, start_date, end_date,
                                     self.request.user.company)
 
-        wb.save(response)
+        save_workbook(wb, response)
 
         add_user_activity(request.user, f"Descargó el reporte de ventas de productos desde {request.data.get('start_date')} hasta {request.data.get('end_date')}")
         return response
@@ -263,7 +262,7 @@ class InvoicesReportExporter(APIView):
                            self.request.user.company_id).select_related("payment_terminal", "InvoiceItems", "created_by")
             .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .annotate(
                 total_invoice=Sum("invoice_items__amount"),
             )
@@ -277,7 +276,7 @@ class InvoicesReportExporter(APIView):
 
         create_invoices_report(ws, inventories_report_data)
 
-        wb.save(response)
+        save_workbook(wb, response)
 
         add_user_activity(request.user, f"Descargó el reporte de facturación desde {request.data.get('start_date')} hasta {request.data.get('end_date')}")
         return response
@@ -319,7 +318,7 @@ class ElectronicInvoiceExporter(APIView):
                                            "created_by")
             .filter(created_at__range=(start, end))
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .annotate(
                 descuento=ExpressionWrapper(
                     F("invoice_items__discount") / 100.0, output_field=DecimalField(decimal_places=2)
@@ -416,7 +415,7 @@ class ElectronicInvoiceExporter(APIView):
                                            "created_by")
             .filter(created_at__range=(start, end))
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .annotate(
                 row_number=Window(
                     expression=RowNumber(),
@@ -440,7 +439,7 @@ class ElectronicInvoiceExporter(APIView):
                            ).select_related("invoice_number", "InvoiceItems")
             .filter(created_at__range=(start, end))
             .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
+            .filter(invoice_items__is_gift=False, invoice_items__is_override=False)
             .annotate(
                 sum_amount=Sum("invoice_items__amount")
             )
@@ -452,7 +451,7 @@ class ElectronicInvoiceExporter(APIView):
 
         electronic_invoice_report_by_invoice(ws3, payment_methods_report, amount_report)
 
-        wb.save(response)
+        save_workbook(wb, response)
 
         add_user_activity(request.user, f"Descargó el reporte de facturación electrónica {start} hasta {end}")
         return response
\ No newline at end of file
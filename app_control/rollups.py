@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import InvoiceItem, SalesRollup, VersionCounter, SALES_SCOPE
+
+# Columns added up per (company, date, hour, seller, item)
+ROLLUP_MEASURES = ("quantity", "amount", "usd_amount", "dollar_usd_amount", "gift_quantity", "gift_amount",
+                   "voided_quantity", "voided_amount")
+
+# First key of the per company advisory locks taken on the rollups
+ROLLUP_LOCK = 2023
+
+# Invoice line fields read by invoice_lines, in the order line_measures expects them
+LINE_FIELDS = ("invoice__created_at", "invoice__sale_by_id", "item_id", "quantity", "amount", "usd_amount", "is_gift",
+               "invoice__is_dollar", "is_override", "invoice__is_override")
+
+
+def invoice_lines(invoice_items):
+    return invoice_items.values_list(*LINE_FIELDS)
+
+
+def line_key(company_id, created_at, seller_id, item_id):
+    local = timezone.localtime(created_at)
+    return company_id, local.date(), local.hour, seller_id or 0, item_id or 0
+
+
+def line_measures(quantity, amount, usd_amount, is_gift, is_dollar, is_voided):
+    if is_voided:
+        return {"voided_quantity": quantity, "voided_amount": amount}
+    if is_gift:
+        return {"gift_quantity": quantity, "gift_amount": amount}
+    return {"quantity": quantity, "amount": amount, "usd_amount": usd_amount,
+            "dollar_usd_amount": usd_amount if is_dollar else 0}
+
+
+def rollup_deltas(company_id, lines, sign=1, deltas=None):
+    """
+    Adds the measures of ``lines`` (LINE_FIELDS tuples) to ``deltas`` by rollup
+    key, multiplied by ``sign``.
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(ROLLUP_MEASURES, 0)) if deltas is None else deltas
+    for (created_at, seller_id, item_id, quantity, amount, usd_amount, is_gift, is_dollar, is_override,
+         invoice_is_override) in lines:
+        measures = line_measures(quantity, amount or 0, usd_amount or 0, is_gift, is_dollar,
+                                 is_override or invoice_is_override)
+        row = deltas[line_key(company_id, created_at, seller_id, item_id)]
+        for name, value in measures.items():
+            row[name] += sign * value
+    return deltas
+
+
+def apply_rollup_deltas(deltas, batch_size=1000):
+    """
+    Adds ``deltas`` to the rollup rows with one ``INSERT ... ON CONFLICT DO
+    UPDATE`` per batch, creating the missing rows. The sales version of the
+    companies is bumped once the transaction commits, dropping their cached
+    stats. Call it inside the transaction that changed the invoices.
+    """
+    rows = list(deltas.items())
+    company_ids = sorted({key[0] for key in deltas})
+    table = connection.ops.quote_name(SalesRollup._meta.db_table)
+    columns = ("company_id", "date", "hour", "seller_id", "item_id") + ROLLUP_MEASURES
+    updates = ", ".join(f"{name} = {table}.{name} + EXCLUDED.{name}" for name in ROLLUP_MEASURES)
+
+    with connection.cursor() as cursor:
+        # Shared, so sales don't wait for each other, only for a running rebuild_rollups
+        for company_id in company_ids:
+            cursor.execute("SELECT pg_advisory_xact_lock_shared(%s, %s)", [ROLLUP_LOCK, company_id])
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for (company_id, date, hour, seller_id, item_id), measures in batch:
+                params += [company_id, connection.ops.adapt_datefield_value(date), hour, seller_id, item_id]
+                params += [measures[name] for name in ROLLUP_MEASURES]
+
+            placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT (company_id, date, hour, seller_id, item_id) DO UPDATE SET {updates}",
+                params
+            )
+
+    for company_id in company_ids:
+        VersionCounter.bump_on_commit(company_id, SALES_SCOPE)
+
+
+def sale_lines(invoice, invoice_items):
+    """LINE_FIELDS tuples of the new InvoiceItem objects of an invoice."""
+    return [(invoice.created_at, invoice.sale_by_id, item.item_id, item.quantity, item.amount, item.usd_amount,
+             item.is_gift, invoice.is_dollar, False, False) for item in invoice_items]
+
+
+def rebuild_rollups(company_id):
+    """
+    Recomputes the rollups of a company from its invoices. Must run inside a
+    transaction: its advisory lock waits for the sales being written and holds
+    new ones in apply_rollup_deltas until the commit, so none is lost or
+    counted twice.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [ROLLUP_LOCK, company_id])
+
+    SalesRollup.objects.filter(company_id=company_id).delete()
+
+    deltas = rollup_deltas(company_id, invoice_lines(
+        InvoiceItem.objects.filter(invoice__company_id=company_id)).iterator(chunk_size=2000))
+    apply_rollup_deltas(deltas)
+    if not deltas:
+        # The deleted rows may still be cached
+        VersionCounter.bump_on_commit(company_id, SALES_SCOPE)
+    return len(deltas)
@@ -0,0 +1,282 @@
+from collections import defaultdict
+
+from django.db.models import F, Sum
+
+from .models import Inventory, Invoice, InvoiceItem, PaymentMethod
+from .numbering import lock_resolution, take_invoice_numbers, RESOLUTION_EXHAUSTED
+from .rollups import invoice_lines, sale_lines, rollup_deltas, apply_rollup_deltas
+from .stock import lock_inventories, apply_stock_changes, shortage_error, StockChange
+
+
+def item_quantities(invoice_item_data):
+    quantities = defaultdict(int)
+    for item in invoice_item_data:
+        quantities[int(item["item_id"])] += item["quantity"]
+    return quantities
+
+
+def stock_error(quantities, inventories, available):
+    """
+    Returns the error of a sale whose products are missing or don't have enough
+    units left in ``available`` (store units by inventory id), or None.
+    """
+    missing = [str(item_id) for item_id in quantities if item_id not in inventories]
+    if missing:
+        return f"Productos no encontrados: {', '.join(missing)}"
+
+    shortages = [inventories[item_id].code for item_id, quantity in quantities.items()
+                 if available[item_id] < quantity]
+    if shortages:
+        return f"items with code {', '.join(shortages)} does not have enough quantity"
+
+    return None
+
+
+def build_invoice_items(invoice, invoice_item_data, inventories, company_id):
+    invoice_items = []
+    for item in invoice_item_data:
+        inventory = inventories[int(item["item_id"])]
+        invoice_items.append(InvoiceItem(
+            invoice=invoice,
+            item=inventory,
+            item_name=inventory.name,
+            item_code=inventory.code,
+            quantity=item["quantity"],
+            amount=item["amount"],
+            usd_amount=item["usd_amount"],
+            discount=item["discount"],
+            original_amount=item["quantity"] * inventory.selling_price,
+            original_usd_amount=item["quantity"] * inventory.usd_price,
+            is_gift=item["is_gift"],
+            company_id=company_id
+        ))
+    return invoice_items
+
+
+def sale_inventories(invoice_item_data, company_id):
+    """
+    Reads the products of a sale once and checks they exist and have the units
+    in store. Returns them by id; raises when the sale can't be fulfilled.
+    """
+    quantities = item_quantities(invoice_item_data)
+    inventories = Inventory.objects.filter(company_id=company_id).in_bulk(quantities.keys())
+
+    error = stock_error(quantities, inventories,
+                        {item_id: inventory.total_in_shops for item_id, inventory in inventories.items()})
+    if error:
+        raise Exception(error)
+    return inventories
+
+
+def commit_invoice_items(invoice, invoice_item_data, company_id, inventories=None):
+    """
+    Stores the lines of a sale as a set: reads every referenced product once
+    (or takes the ones already checked by sale_inventories), bulk inserts the
+    items and decrements the stock with one conditional UPDATE, so the products
+    are only locked from that statement until the commit and a concurrent
+    checkout can't take the same units. Must run inside a transaction.
+    """
+    quantities = item_quantities(invoice_item_data)
+    if inventories is None:
+        inventories = sale_inventories(invoice_item_data, company_id)
+
+    invoice_items = build_invoice_items(invoice, invoice_item_data, inventories, company_id)
+
+    InvoiceItem.objects.bulk_create(invoice_items)
+    failed = apply_stock_changes(company_id, "invoice", [
+        StockChange(item_id, "store", -quantity, invoice.id) for item_id, quantity in quantities.items()
+    ])
+    if failed:
+        raise Exception(shortage_error(company_id, failed))
+
+    apply_rollup_deltas(rollup_deltas(company_id, sale_lines(invoice, invoice_items)))
+
+    return invoice_items
+
+
+def commit_invoices(invoices_data, company_id, resolution_id):
+    """
+    Stores several validated invoices (InvoiceSerializer validated data) with
+    one lock of all their products, one insert per table and one stock UPDATE.
+    Sales are checked in order against the remaining stock; the ones that can't
+    be fulfilled are skipped and only the accepted ones are numbered, with one
+    UPDATE of the resolution right before the INSERT. Returns an (invoice,
+    error) pair per sale. The products stay locked for the whole batch, as each
+    sale is checked against the units left by the previous ones. Must run
+    inside a transaction.
+    """
+    sales = [(data, item_quantities(data["invoice_item_data"])) for data in invoices_data]
+
+    # Taken before the products, in the same order as a single sale, so the two can't deadlock
+    lock_resolution(resolution_id)
+    inventories = lock_inventories(company_id, {item_id for _, quantities in sales for item_id in quantities})
+    available = {item_id: inventory.total_in_shops for item_id, inventory in inventories.items()}
+
+    results = []
+    for data, quantities in sales:
+        error = stock_error(quantities, inventories, available)
+        if error:
+            results.append((None, error))
+            continue
+
+        for item_id, quantity in quantities.items():
+            available[item_id] -= quantity
+
+        fields = {name: value for name, value in data.items()
+                  if name not in ("invoice_item_data", "payment_methods")}
+        results.append((Invoice(**fields), None))
+
+    accepted = [(index, invoice, data) for index, ((invoice, _), data) in enumerate(zip(results, invoices_data))
+                if invoice is not None]
+    numbers = take_invoice_numbers(resolution_id, len(accepted))
+    for index, _, _ in accepted[len(numbers):]:
+        results[index] = (None, RESOLUTION_EXHAUSTED)
+    accepted = [(invoice, data) for (_, invoice, data) in accepted[:len(numbers)]]
+
+    for (invoice, _), number in zip(accepted, numbers):
+        invoice.dian_resolution_id = resolution_id
+        invoice.invoice_number = str(number)
+    Invoice.objects.bulk_create([invoice for invoice, _ in accepted])
+
+    invoice_items = []
+    payment_methods = []
+    stock_changes = []
+    lines = []
+    for invoice, data in accepted:
+        items = build_invoice_items(invoice, data["invoice_item_data"], inventories, company_id)
+        invoice_items += items
+        lines += sale_lines(invoice, items)
+        payment_methods += [PaymentMethod(invoice=invoice, **{**payment_method, "company_id": company_id})
+                            for payment_method in data["payment_methods"]]
+        stock_changes += [StockChange(item_id, "store", -quantity, invoice.id)
+                          for item_id, quantity in item_quantities(data["invoice_item_data"]).items()]
+
+    InvoiceItem.objects.bulk_create(invoice_items)
+    PaymentMethod.objects.bulk_create(payment_methods)
+    failed = apply_stock_changes(company_id, "invoice", stock_changes)
+    if failed:
+        raise Exception(shortage_error(company_id, failed))
+
+    apply_rollup_deltas(rollup_deltas(company_id, lines))
+
+    return results
+
+
+def check_payment_methods(payment_methods):
+    if not payment_methods:
+        raise Exception("Debe ingresar los métodos de pago")
+
+    for method in payment_methods:
+        if (method.get("name") is None or method.get("paid_amount") is None or method.get(
+                "back_amount") is None or method.get("received_amount") is None):
+            raise Exception(
+                "Los métodos de pago deben tener nombre, monto pagado, monto de vuelto y monto recibido")
+
+
+def replace_payment_methods(changes, company_id):
+    """
+    Replaces the payment methods of several invoices with one DELETE and one
+    INSERT. ``changes`` maps each invoice id to its new payment methods and,
+    optionally, new payment_terminal_id / is_dollar values; invoices with the
+    same new values are updated together. Returns the previous method names by
+    invoice id. Must run inside a transaction.
+    """
+    old_payment_methods = defaultdict(list)
+    payment_methods = PaymentMethod.objects.filter(invoice_id__in=changes.keys())
+    for invoice_id, name in payment_methods.values_list("invoice_id", "name"):
+        old_payment_methods[invoice_id].append(name)
+
+    payment_methods.delete()
+    PaymentMethod.objects.bulk_create([
+        PaymentMethod(
+            invoice_id=invoice_id,
+            name=method.get("name"),
+            paid_amount=method.get("paid_amount"),
+            back_amount=method.get("back_amount"),
+            received_amount=method.get("received_amount"),
+            transaction_code=method.get("transaction_code", None),
+            company_id=company_id
+        ) for invoice_id, change in changes.items() for method in change["payment_methods"]
+    ])
+
+    invoice_updates = defaultdict(list)
+    for invoice_id, change in changes.items():
+        fields = tuple((name, change[name]) for name in ("payment_terminal_id", "is_dollar") if name in change)
+        if fields:
+            invoice_updates[fields].append(invoice_id)
+
+    # Lines of the invoices changing currency move between the dollar columns of the rollups
+    dollar_changes = {invoice_id: change["is_dollar"] for invoice_id, change in changes.items() if "is_dollar" in change}
+    changed = [invoice_id for invoice_id, is_dollar in
+               Invoice.objects.filter(pk__in=dollar_changes).values_list("id", "is_dollar")
+               if is_dollar != bool(dollar_changes[invoice_id])]
+    if changed:
+        lines = list(invoice_lines(InvoiceItem.objects.filter(invoice_id__in=changed)))
+        deltas = rollup_deltas(company_id, lines, sign=-1)
+        apply_rollup_deltas(rollup_deltas(company_id, [
+            (*line[:7], not line[7], *line[8:]) for line in lines
+        ], deltas=deltas))
+
+    for fields, invoice_ids in invoice_updates.items():
+        Invoice.objects.filter(pk__in=invoice_ids).update(**dict(fields))
+
+    return old_payment_methods
+
+
+def void_invoice_items(invoice, invoice_item_ids=None):
+    """
+    Voids the given lines of an invoice, or all of them, and returns their units
+    to the store stock with one UPDATE grouped by product (deleted products are
+    skipped). The invoice is voided once none of its lines is left; until then
+    its payment methods are scaled down to the amount still sold. Must run
+    inside a transaction, with the invoice row locked.
+    """
+    invoice_items = InvoiceItem.objects.filter(invoice=invoice, is_override=False)
+    if invoice_item_ids is not None:
+        invoice_items = invoice_items.filter(pk__in=invoice_item_ids)
+
+    voided = list(invoice_items.values_list("id", "item_id", "quantity"))
+    if invoice_item_ids is not None and len(voided) != len(set(invoice_item_ids)):
+        raise Exception("Algunos productos no pertenecen a la factura o ya están anulados")
+
+    lines = list(invoice_lines(invoice_items))
+
+    quantities = defaultdict(int)
+    for _, item_id, quantity in voided:
+        if item_id is not None:
+            quantities[item_id] += quantity
+
+    InvoiceItem.objects.filter(pk__in=[invoice_item_id for invoice_item_id, _, _ in voided]).update(is_override=True)
+    failed = apply_stock_changes(invoice.company_id, "void", [
+        StockChange(item_id, "store", quantity, invoice.id) for item_id, quantity in quantities.items()
+    ])
+    if failed:
+        raise Exception(f"No se pudieron devolver las unidades de los productos: {', '.join(map(str, failed))}")
+
+    deltas = rollup_deltas(invoice.company_id, lines, sign=-1)
+    apply_rollup_deltas(rollup_deltas(invoice.company_id, [(*line[:8], True, line[9]) for line in lines],
+                                      deltas=deltas))
+
+    if invoice_item_ids is None or not InvoiceItem.objects.filter(invoice=invoice, is_override=False).exists():
+        invoice.is_override = True
+        Invoice.objects.filter(pk=invoice.pk).update(is_override=True)
+    else:
+        rebalance_payment_methods(invoice, sum(line[4] or 0 for line in lines if not line[6]))
+
+    return voided
+
+
+def rebalance_payment_methods(invoice, voided_amount):
+    """
+    Scales every payment method of a partly voided invoice by the share of its
+    amount (gifts excluded) still sold, so card, transfer and cash totals stop
+    counting the voided lines. The share doesn't depend on the currency the
+    methods were paid in.
+    """
+    if not voided_amount:
+        return
+
+    remaining = InvoiceItem.objects.filter(invoice=invoice, is_override=False, is_gift=False).aggregate(
+        amount=Sum("amount"))["amount"] or 0
+    PaymentMethod.objects.filter(invoice=invoice).update(
+        paid_amount=F("paid_amount") * remaining / (remaining + voided_amount))
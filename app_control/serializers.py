@@ -1,10 +1,13 @@
-from django.db.models import Sum
+from django.db.models import Sum, prefetch_related_objects
 
 from .models import (Goals, Inventory, InventoryGroup, PaymentMethod, Invoice, InvoiceItem, DianResolution,
-                     PaymentTerminal, Provider, Customer, Document_types, InventoryMovement, InventoryMovementItem)
+                     PaymentTerminal, Provider, Customer, Document_types, InventoryMovement, InventoryMovementItem,
+                     MovementJob)
 
 from .models import Inventory, InventoryGroup, PaymentMethod, Invoice, InvoiceItem, DianResolution, Provider, \
     PaymentTerminal
+from .numbering import next_invoice_number
+from .sales import commit_invoice_items, sale_inventories
 from user_control.serializers import CustomUserSerializer, CustomUserNamesSerializer, CompanySerializer
 from rest_framework import serializers
 
@@ -81,7 +84,7 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
 
 class InvoiceItemDataSerializer(serializers.Serializer):
     item_id = serializers.CharField()
-    quantity = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
     discount = serializers.FloatField()
     amount = serializers.FloatField()
     usd_amount = serializers.FloatField()
@@ -137,6 +140,12 @@ class InvoiceSerializer(serializers.ModelSerializer):
         model = Invoice
         exclude = ("company",)
 
+    def to_representation(self, instance):
+        if self.context.get("compact"):
+            prefetch_related_objects([instance], "invoice_items", "payment_methods")
+            return InvoiceCompactSerializer(instance, context=self.context).data
+        return super().to_representation(instance)
+
     def create(self, validated_data):
         invoice_item_data = validated_data.pop("invoice_item_data")
         payment_methods_data = validated_data.pop("payment_methods", [])
@@ -147,25 +156,17 @@ class InvoiceSerializer(serializers.ModelSerializer):
         if not payment_methods_data:
             raise Exception("You need to provide at least one Payment method")
 
+        inventories = sale_inventories(invoice_item_data, validated_data["company_id"])
+        # Last step before the INSERT, a sale that fails after it rolls its number back
+        validated_data["invoice_number"] = str(next_invoice_number(validated_data["dian_resolution_id"]))
         invoice = super().create(validated_data)
 
-        invoice_item_serializer = InvoiceItemSerializer(data=[
-            {"invoice_id": invoice.id,
-             "company_id": validated_data["company_id"],
-             **item} for item in invoice_item_data
-        ], many=True)
-
-        if invoice_item_serializer.is_valid():
-            invoice_item_serializer.save()
-        else:
-            invoice.delete()
-            raise Exception(invoice_item_serializer.errors)
+        commit_invoice_items(invoice, invoice_item_data, validated_data["company_id"], inventories)
 
-        for payment_method_data in payment_methods_data:
-            PaymentMethod.objects.create(
-                invoice=invoice,
-                company_id=validated_data["company_id"],
-                **payment_method_data)
+        PaymentMethod.objects.bulk_create([
+            PaymentMethod(invoice=invoice, **{**payment_method_data, "company_id": validated_data["company_id"]})
+            for payment_method_data in payment_methods_data
+        ])
 
         return invoice
 
@@ -193,9 +194,9 @@ class InvoiceSerializer(serializers.ModelSerializer):
         else:
             raise Exception(invoice_item_serializer.errors)
 
-        for payment_method_data in payment_methods_data:
-            PaymentMethod.objects.create(
-                invoice=invoice, **payment_method_data)
+        PaymentMethod.objects.bulk_create([
+            PaymentMethod(invoice=invoice, **payment_method_data) for payment_method_data in payment_methods_data
+        ])
 
         return invoice
 
@@ -226,6 +227,48 @@ class InvoiceSimpleSerializer(serializers.ModelSerializer):
                   "payment_terminal", "payment_methods", "sale_by", "total_sum", "total_sum_usd", "company_id")
 
 
+class InvoiceItemCompactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InvoiceItem
+        fields = ("id", "item_id", "item_code", "item_name", "quantity", "amount", "usd_amount", "discount",
+                  "is_gift", "is_override")
+
+
+class PaymentMethodCompactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentMethod
+        fields = ("name", "paid_amount", "received_amount", "back_amount", "transaction_code")
+
+
+class InvoiceCompactSerializer(serializers.ModelSerializer):
+    """
+    Receipt representation of an invoice: ids, numbers, totals and line data,
+    without nested users, companies or inventories.
+    """
+    customer_id = serializers.IntegerField(read_only=True)
+    sale_by_id = serializers.IntegerField(read_only=True)
+    created_by_id = serializers.IntegerField(read_only=True)
+    payment_terminal_id = serializers.IntegerField(read_only=True)
+    dian_resolution_id = serializers.IntegerField(read_only=True)
+    invoice_items = InvoiceItemCompactSerializer(read_only=True, many=True)
+    payment_methods = PaymentMethodCompactSerializer(read_only=True, many=True)
+    total_sum = serializers.SerializerMethodField()
+    total_sum_usd = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Invoice
+        fields = ("id", "invoice_number", "is_dollar", "is_override", "created_at", "customer_id", "sale_by_id",
+                  "created_by_id", "payment_terminal_id", "dian_resolution_id", "total_sum", "total_sum_usd",
+                  "invoice_items", "payment_methods")
+
+    def get_total_sum(self, obj):
+        return sum(item.amount or 0 for item in obj.invoice_items.all() if not item.is_gift and not item.is_override)
+
+    def get_total_sum_usd(self, obj):
+        return sum(item.usd_amount or 0 for item in obj.invoice_items.all()
+                   if not item.is_gift and not item.is_override)
+
+
 class GoalSerializer(serializers.ModelSerializer):
     company_id = serializers.IntegerField(required=False)
 
@@ -264,11 +307,11 @@ class InventoryMovementSerializer(serializers.ModelSerializer):
 
         movement = super().create(validated_data)
 
-        for movement_items_data in movement_items:
-            InventoryMovementItem.objects.create(
-                inventory_movement=movement,
-                company_id=validated_data["company_id"],
-                **movement_items_data)
+        InventoryMovementItem.objects.bulk_create([
+            InventoryMovementItem(inventory_movement=movement, company_id=validated_data["company_id"],
+                                  **movement_items_data)
+            for movement_items_data in movement_items
+        ])
 
         return movement
 
@@ -279,10 +322,22 @@ class InventoryMovementSerializer(serializers.ModelSerializer):
 
         if movement_items:
             InventoryMovementItem.objects.filter(inventory_movement=movement).delete()
-            for movement_items_data in movement_items:
-                InventoryMovementItem.objects.create(
-                    inventory_movement=movement,
-                    company_id=validated_data["company_id"],
-                    **movement_items_data)
+            InventoryMovementItem.objects.bulk_create([
+                InventoryMovementItem(inventory_movement=movement, company_id=validated_data["company_id"],
+                                      **movement_items_data)
+                for movement_items_data in movement_items
+            ])
 
         return movement
+
+
+class MovementJobSerializer(serializers.ModelSerializer):
+    created_by = CustomUserNamesSerializer(read_only=True)
+    progress = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = MovementJob
+        exclude = ("company",)
+
+    def get_progress(self, obj):
+        return round(obj.processed_items * 100 / obj.total_items, 1) if obj.total_items else 100.0
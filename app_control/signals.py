@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .lookup import invalidate_products
+from .models import Inventory, InventoryGroup
+
+
+@receiver([post_save, post_delete], sender=Inventory)
+def invalidate_cached_product(sender, instance, **kwargs):
+    invalidate_products(instance.company_id, [instance.id])
+
+
+@receiver(post_delete, sender=InventoryGroup)
+def invalidate_cached_group_products(sender, instance, **kwargs):
+    invalidate_products(instance.company_id)
@@ -1,295 +1,278 @@
+import hashlib
+import json
+from collections import defaultdict
 from datetime import datetime, timedelta
+from functools import wraps
 
-from django.db.models.functions.datetime import ExtractHour, ExtractDay, ExtractMonth, ExtractWeek
-from django.db.models.functions.text import Concat
+from django.core.cache import caches
+from django.utils import timezone
 
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
 from inventory_api.utils import filter_company
-from .serializers import (
-    Inventory, Invoice, InvoiceItem
-)
+from .models import Goals, SalesRollup, VersionCounter, CATALOG_SCOPE, SALES_SCOPE
+from .serializers import GoalSerializer, Inventory
 from rest_framework.response import Response
 from rest_framework import status
 from inventory_api.custom_methods import IsAuthenticatedCustom
-from django.db.models import Sum, F, Q, Value, CharField
+from django.db.models import Case, When, Value, Sum, F
 from django.db.models.functions import Coalesce
 from user_control.models import CustomUser
 from .views import InventoryView, InventoryGroupView, InvoiceView
 
 
+MONTH_NAMES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre',
+               'Octubre', 'Noviembre', 'Diciembre']
+
+
+def cached_stats(*scopes):
+    """
+    Caches the successful responses of a stats view per company, request and
+    current version of the given scopes (CATALOG_SCOPE, SALES_SCOPE), so every
+    user of the company polling it shares one answer until the data changes.
+    Data without a version (users, groups, goals) refreshes after STATS_CACHE_TTL.
+    """
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            company_id = request.user.company_id
+            # Read before the data, a change committed in between is only cached under the old version
+            versions = dict(VersionCounter.objects.filter(company_id=company_id, scope__in=scopes).values_list(
+                "scope", "value"))
+
+            data = request.data.dict() if hasattr(request.data, "dict") else request.data
+            payload = json.dumps([request.get_full_path(), data], sort_keys=True, default=str)
+            version = ":".join(str(versions.get(scope, 0)) for scope in scopes)
+            key = f"stats:{company_id}:{timezone.localdate()}:{version}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+            stats_cache = caches["stats"]
+            cached = stats_cache.get(key)
+            if cached is not None:
+                return Response(cached)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                stats_cache.set(key, response.data)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def date_range(data):
+    """Optional start_date / end_date (YYYY-MM-DD) of a stats request, both or none."""
+    start_date = data.get("start_date", None)
+    end_date = data.get("end_date", None)
+
+    if start_date and not end_date:
+        raise Exception("Debe ingresar una fecha de fin")
+    if not start_date and end_date:
+        raise Exception("Debe ingresar una fecha de inicio")
+    if not start_date:
+        return None, None
+
+    return datetime.strptime(start_date, "%Y-%m-%d").date(), datetime.strptime(end_date, "%Y-%m-%d").date()
+
+
+def summary_counts(company_id):
+    return {
+        "total_inventory": filter_company(InventoryView.queryset, company_id).filter(active=True).count(),
+        "total_group": filter_company(InventoryGroupView.queryset, company_id).filter(active=True).count(),
+        "total_users": filter_company(CustomUser.objects, company_id).filter(
+            is_superuser=False).filter(is_active=True).count()
+    }
+
+
+def sales_totals(company_id, start_date, today):
+    """
+    Sold amount by local date from start_date to today and sold quantity by hour
+    of today, with one rollup query: the hours of the other days are grouped
+    together.
+    """
+    rows = (
+        filter_company(SalesRollup.objects, company_id)
+        .filter(date__gte=start_date, date__lte=today)
+        .values('date', today_hour=Case(When(date=today, then=F('hour')), default=Value(-1)))
+        .annotate(total_amount=Sum('amount'), total_quantity=Sum('quantity'))
+        .order_by()
+    )
+
+    amounts = defaultdict(float)
+    quantities = {}
+    for row in rows:
+        amounts[row['date']] += row['total_amount']
+        if row['today_hour'] >= 0:
+            quantities[row['today_hour']] = row['total_quantity']
+
+    return amounts, quantities
+
+
+def hourly_series(quantities):
+    return [{'time': hour, 'total_quantity': quantities.get(hour, 0)} for hour in range(24)]
+
+
+def daily_series(amounts, today):
+    days = [today - timedelta(days=i) for i in reversed(range(7))]
+    return [{'day': f'{day.day}/{day.month}', 'total_amount': amounts.get(day, 0)} for day in days]
+
+
+def weekly_series(amounts, today):
+    totals = defaultdict(float)
+    for day, amount in amounts.items():
+        totals[day.isocalendar()[:2]] += amount
+
+    weeks = [today - timedelta(weeks=i) for i in reversed(range(5))]
+    return [{'week_number': f"Week {week.strftime('%V')}", 'total_amount': totals.get(week.isocalendar()[:2], 0)}
+            for week in weeks]
+
+
+def monthly_series(amounts, today):
+    totals = defaultdict(float)
+    for day, amount in amounts.items():
+        if day.year == today.year:
+            totals[day.month] += amount
+
+    return [{'month': name, 'total_amount': totals.get(month, 0)} for month, name in enumerate(MONTH_NAMES, start=1)]
+
+
+def general_totals(amounts, today):
+    starts = {
+        'diary': today,
+        'weekly': today - timedelta(days=today.weekday()),
+        'monthly': today.replace(day=1),
+        'annual': today.replace(month=1, day=1),
+    }
+    return {name: sum(amount for day, amount in amounts.items() if day >= start) for name, start in starts.items()}
+
+
+# First day read and series built from the amounts by day, per timeframe
+TIMEFRAMES = {
+    'daily': (lambda today: today - timedelta(days=7), daily_series),
+    'weekly': (lambda today: today - timedelta(weeks=5), weekly_series),
+    'monthly': (lambda today: today.replace(month=1, day=1), monthly_series),
+    'general': (lambda today: min(today.replace(month=1, day=1), today - timedelta(days=today.weekday())),
+                general_totals),
+}
+
+
+def top_selling_items(company_id, start_date=None, end_date=None):
+    query = filter_company(SalesRollup.objects, company_id).filter(
+        item_id__in=filter_company(Inventory.objects, company_id).values("id"))
+    if start_date:
+        query = query.filter(date__gte=start_date, date__lte=end_date)
+
+    top_items = list(query.values("item_id").annotate(sum_top_ten_items=Sum("quantity")).filter(
+        sum_top_ten_items__gt=0).order_by("-sum_top_ten_items")[0:10])
+    inventories = Inventory.objects.only("id", "name", "photo").in_bulk([item["item_id"] for item in top_items])
+
+    return [{"name": inventories[item["item_id"]].name, "photo": inventories[item["item_id"]].photo,
+             "sum_top_ten_items": item["sum_top_ten_items"]} for item in top_items]
+
+
+def purchase_summary(company_id, start_date=None, end_date=None):
+    query = filter_company(SalesRollup.objects, company_id)
+    if start_date:
+        query = query.filter(date__gte=start_date, date__lte=end_date)
+
+    results = query.aggregate(
+        amount_total_no_gifts=Sum('amount'),
+        total=Coalesce(Sum('quantity'), 0),
+        gift_total=Coalesce(Sum('gift_quantity'), 0),
+        amount_total_usd=Sum('dollar_usd_amount'),
+        amount_total_gifts=Sum('gift_amount')
+    )
+
+    return {
+        "count": results["total"],
+        "gift_count": results["gift_total"],
+        "selling_price": results["amount_total_no_gifts"] or 0,
+        "selling_price_gifts": results["amount_total_gifts"] or 0,
+        "price_dolar": results["amount_total_usd"] or 0
+    }
+
+
 class SummaryView(ModelViewSet):
     http_method_names = ('get',)
     permission_classes = (IsAuthenticatedCustom,)
 
+    @cached_stats(CATALOG_SCOPE)
     def list(self, request, *args, **kwargs):
-        total_inventory = filter_company(InventoryView.queryset, self.request.user.company_id).filter(active=True).count()
-        total_group = filter_company(InventoryGroupView.queryset, self.request.user.company_id).filter(active=True).count()
-        total_users = filter_company(CustomUser.objects, self.request.user.company_id).filter(is_superuser=False).filter(is_active=True).count()
-
-        return Response({
-            "total_inventory": total_inventory,
-            "total_group": total_group,
-            "total_users": total_users
-        })
+        return Response(summary_counts(self.request.user.company_id))
 
 
 class SalePerformance(ModelViewSet):
     http_method_names = ('post',)
     permission_classes = (IsAuthenticatedCustom,)
 
+    @cached_stats(SALES_SCOPE, CATALOG_SCOPE)
     def top_selling(self, request, *args, **kwargs):
-        query = filter_company(Inventory.objects.all(), self.request.user.company_id)
-        start_date = request.data.get("start_date", None)
-        end_date = request.data.get("end_date", None)
+        try:
+            start_date, end_date = date_range(request.data)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if start_date or end_date:
-            if start_date and not end_date:
-                return Response({"error": "Debe ingresar una fecha de fin"}, status=status.HTTP_400_BAD_REQUEST)
-            if not start_date and end_date:
-                return Response({"error": "Debe ingresar una fecha de inicio"}, status=status.HTTP_400_BAD_REQUEST)
-            start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-            query = query.filter(inventory_invoices__invoice__created_at__date__gte=start_date,
-                                 inventory_invoices__invoice__created_at__date__lte=end_date,
-                                 inventory_invoices__invoice__is_override=False, inventory_invoices__is_gift=False)
-        else:
-            query = query.filter(inventory_invoices__invoice__is_override=False, inventory_invoices__is_gift=False)
-
-        items = query.values("name", "photo").annotate(
-            sum_top_ten_items=Coalesce(
-                Sum("inventory_invoices__quantity"), 0
-            )
-        ).order_by('-sum_top_ten_items')[0:10]
-
-        return Response(items)
+        return Response(top_selling_items(self.request.user.company_id, start_date, end_date))
 
 
 class HourlySalesQuantities(ModelViewSet):
     http_method_names = ('get',)
     permission_classes = (IsAuthenticatedCustom,)
 
+    @cached_stats(SALES_SCOPE)
     def list(self, request, *args, **kwargs):
-        hours = [{'time': hour, 'total_quantity': 0} for hour in range(24)]
-
-        data = (
-            filter_company(Invoice.objects.all(), self.request.user.company_id)
-            .filter(is_override=False)
-            .filter(invoice_items__is_gift=False)
-            .filter(created_at__gte=datetime.now().date())
-            .annotate(
-                time=ExtractHour('created_at')
-            ).values(
-                'time'
-            ).annotate(
-                total_quantity=Sum('invoice_items__quantity')
-            ).order_by('time')
-        )
-
-        sales_dict = {item['time']: item['total_quantity'] for item in data}
+        today = timezone.localdate()
+        _, quantities = sales_totals(self.request.user.company_id, today, today)
 
-        # Update the hours list with sales data
-        for hour in hours:
-            if hour['time'] in sales_dict:
-                hour['total_quantity'] = sales_dict[hour['time']]
-
-        return Response(hours)
+        return Response(hourly_series(quantities))
 
 
 class SalesBySelectedTimeframeSummary(ModelViewSet):
     http_method_names = ('get',)
     permission_classes = (IsAuthenticatedCustom,)
 
+    @cached_stats(SALES_SCOPE)
     def list(self, request, *args, **kwargs):
         timeframe = request.GET.get('type', None)
 
-        if timeframe == 'daily':
-            days = []
-            for i in range(7):
-                date_begin = datetime.now() - timedelta(days=i)
-                day = f'{date_begin.day}/{date_begin.month}'
-                days.append({'day': day, 'total_amount': 0})
-
-            days.reverse()
-
-            data = (
-                filter_company(Invoice.objects.all(), self.request.user.company_id)
-                .filter(is_override=False)
-                .filter(invoice_items__is_gift=False)
-                .filter(created_at__gte=datetime.now().date() - timedelta(days=7))
-                .annotate(
-                    day=Concat(
-                        ExtractDay('created_at'),
-                        Value('/'),
-                        ExtractMonth('created_at'),
-                        output_field=CharField()
-                    )
-                ).values(
-                    'day'
-                ).annotate(
-                    total_amount=Sum('invoice_items__amount')
-                ).order_by('day')
-            )
-
-            sales_dict = {item['day']: item['total_amount'] for item in data}
-
-            for day in days:
-                if day['day'] in sales_dict:
-                    day['total_amount'] = sales_dict[day['day']]
-
-            return Response(days)
-
-        elif timeframe == 'weekly':
-            weeks = []
-            for i in range(5):
-                date_begin = datetime.now() - timedelta(weeks=i)
-                week_number = f"Week {date_begin.strftime('%V')}"
-                weeks.append({'week_number': week_number, 'total_amount': 0})
-
-            weeks.reverse()
-
-            data = (
-                filter_company(Invoice.objects.all(), self.request.user.company_id)
-                .filter(is_override=False)
-                .filter(invoice_items__is_gift=False)
-                .filter(created_at__gte=datetime.now().date() - timedelta(weeks=5))
-                .annotate(
-                    week_number=Concat(Value("Week "), ExtractWeek('created_at'), output_field=CharField())
-                )
-                .values('week_number')
-                .annotate(
-                    total_amount=Sum('invoice_items__amount')
-                )
-                .order_by('week_number')
-            )
-
-            sales_dict = {item['week_number']: item['total_amount'] for item in data}
-
-            for week in weeks:
-                if week['week_number'] in sales_dict:
-                    week['total_amount'] = sales_dict[week['week_number']]
-
-            return Response(weeks)
-
-        elif timeframe == 'monthly':
-            months = []
-            month_names = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre',
-                           'Octubre', 'Noviembre', 'Diciembre']
-            current_year = datetime.now().year
-
-            for i in range(1, 13):
-                date_begin = datetime(current_year, i, 1)
-                month_name = month_names[date_begin.month - 1]
-                months.append({'month': month_name, 'total_amount': 0})
-
-            data = (
-                filter_company(Invoice.objects.all(), self.request.user.company_id)
-                .filter(is_override=False)
-                .filter(invoice_items__is_gift=False)
-                .filter(created_at__year=current_year)
-                .annotate(
-                    month=ExtractMonth('created_at'),
-                )
-                .values('month')
-                .annotate(
-                    total_amount=Sum('invoice_items__amount')
-                )
-                .order_by('month')
-            )
-
-            sales_dict = {month_names[item['month'] - 1]: item['total_amount'] for item in data}
-
-            for month in months:
-                if month['month'] in sales_dict:
-                    month['total_amount'] = sales_dict[month['month']]
-
-            return Response(months)
-
-        elif timeframe == 'general':
-            today = datetime.now().date()
-            current_week_start = today - timedelta(days=today.weekday())
-            current_month_start = today.replace(day=1)
-            current_year_start = today.replace(month=1, day=1)
-
-            invoices_queryset = filter_company(Invoice.objects.all(), self.request.user.company_id)
-
-            total_day = invoices_queryset.filter(
-                is_override=False,
-                invoice_items__is_gift=False,
-                created_at__date=today
-            ).aggregate(total_amount=Sum('invoice_items__amount'))['total_amount'] or 0
-
-            total_week = invoices_queryset.filter(
-                is_override=False,
-                invoice_items__is_gift=False,
-                created_at__gte=current_week_start
-            ).aggregate(total_amount=Sum('invoice_items__amount'))['total_amount'] or 0
-
-            total_month = invoices_queryset.filter(
-                is_override=False,
-                invoice_items__is_gift=False,
-                created_at__gte=current_month_start
-            ).aggregate(total_amount=Sum('invoice_items__amount'))['total_amount'] or 0
-
-            total_year = invoices_queryset.filter(
-                is_override=False,
-                invoice_items__is_gift=False,
-                created_at__gte=current_year_start
-            ).aggregate(total_amount=Sum('invoice_items__amount'))['total_amount'] or 0
-
-            general_values = {
-                'diary': total_day,
-                'weekly': total_week,
-                'monthly': total_month,
-                'annual': total_year,
-            }
-
-            return Response(general_values)
-        else:
+        if timeframe not in TIMEFRAMES:
             raise Exception("Param Timeframe necesario: daily, weekly or monthly")
 
+        today = timezone.localdate()
+        window_start, series = TIMEFRAMES[timeframe]
+        amounts, _ = sales_totals(self.request.user.company_id, window_start(today), today)
+
+        return Response(series(amounts, today))
+
 
 class SalesByUsersView(ModelViewSet):
     http_method_names = ('post',)
     permission_classes = (IsAuthenticatedCustom,)
 
+    @cached_stats(SALES_SCOPE)
     def sales_by_user(self, request, *args, **kwargs):
         start_date = request.data.get("start_date", None)
         end_date = request.data.get("end_date", None)
 
-        if not start_date or not end_date:
-            sales_by_user = (
-                filter_company(Invoice.objects.all(), self.request.user.company_id)
-                .select_related("InvoiceItems", "sale_by")
-                .all()
-                .filter(is_override=False)
-                .filter(invoice_items__is_gift=False)
-                .values(
-                    "sale_by__id",
-                    "sale_by__fullname",
-                    "sale_by__daily_goal"
-                )
-                .annotate(
-                    total_invoice=Sum("invoice_items__amount"),
-                )
-            )
-        else:
-            sales_by_user = (
-                filter_company(Invoice.objects.all(), self.request.user.company_id)
-                .select_related("InvoiceItems", "sale_by")
-                .all()
-                .filter(is_override=False)
-                .filter(invoice_items__is_gift=False)
-                .filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
-                .values(
-                    "sale_by__id",
-                    "sale_by__fullname",
-                    "sale_by__daily_goal"
-                )
-                .annotate(
-                    total_invoice=Sum("invoice_items__amount"),
-                )
-            )
+        query = filter_company(SalesRollup.objects, self.request.user.company_id)
+        if start_date and end_date:
+            query = query.filter(date__gte=start_date, date__lte=end_date)
+
+        totals = list(query.values("seller_id").annotate(
+            total_invoice=Sum("amount"), total_quantity=Sum("quantity")).filter(total_quantity__gt=0).order_by())
+        users = CustomUser.objects.in_bulk([total["seller_id"] for total in totals])
+
+        sales_by_user = []
+        for total in totals:
+            user = users.get(total["seller_id"])
+            sales_by_user.append({
+                "sale_by__id": user.id if user else None,
+                "sale_by__fullname": user.fullname if user else None,
+                "sale_by__daily_goal": user.daily_goal if user else None,
+                "total_invoice": total["total_invoice"],
+            })
 
         return Response(sales_by_user)
 
@@ -299,43 +282,44 @@ class PurchaseView(ModelViewSet):
     permission_classes = (IsAuthenticatedCustom,)
     queryset = InvoiceView.queryset
 
+    @cached_stats(SALES_SCOPE)
     def purchase_data(self, request, *args, **kwargs):
-        query = filter_company(InvoiceItem.objects, self.request.user.company_id).select_related("invoice", "item")
-        start_date = request.data.get("start_date", None)
-        end_date = request.data.get("end_date", None)
+        try:
+            start_date, end_date = date_range(request.data)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(purchase_summary(self.request.user.company_id, start_date, end_date))
 
-        if start_date or end_date:
-            if start_date and not end_date:
-                return Response({"error": "Debe ingresar una fecha de fin"}, status=status.HTTP_400_BAD_REQUEST)
-            if not start_date and end_date:
-                return Response({"error": "Debe ingresar una fecha de inicio"}, status=status.HTTP_400_BAD_REQUEST)
-            start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-            query = query.filter(invoice__created_at__date__gte=start_date,
-                                 invoice__created_at__date__lte=end_date).filter(invoice__is_override=False)
-        else:
-            query = query.filter(invoice__is_override=False)
-
-        results = query.aggregate(
-            amount_total_no_gifts=Sum(F('amount'), filter=Q(is_gift=False)),
-            total=Coalesce(Sum(F('quantity'), filter=Q(is_gift=False)), 0),
-            gift_total=Coalesce(Sum(F('quantity'), filter=Q(is_gift=True)), 0),
-            amount_total_usd=Sum(F('usd_amount'), filter=Q(invoice__is_dollar=True, is_gift=False)),
-            amount_total_gifts=Sum(F('amount'), filter=Q(is_gift=True))
-        )
-
-        selling_price = results.get("amount_total_no_gifts", 0)
-        count = results.get("total", 0)
-        gift_count = results.get("gift_total", 0)
-        price_dolar = results.get("amount_total_usd", 0)
-        selling_price_gifts = results.get("amount_total_gifts", 0)
-
-        response_data = {
-            "count": count,
-            "gift_count": gift_count,
-            "selling_price": selling_price or 0,
-            "selling_price_gifts": selling_price_gifts or 0,
-            "price_dolar": price_dolar or 0
-        }
-
-        return Response(response_data)
+
+class DashboardView(APIView):
+    """
+    Everything the home dashboard shows in one request: summary, hourly
+    quantities, the four sales timeframes, top selling products, purchase
+    summary (optionally for ?start_date=&end_date=) and goals. All the sales
+    series come from one rollup query over the widest window.
+    """
+    http_method_names = ('get',)
+    permission_classes = (IsAuthenticatedCustom,)
+
+    @cached_stats(SALES_SCOPE, CATALOG_SCOPE)
+    def get(self, request, *args, **kwargs):
+        try:
+            start_date, end_date = date_range(request.query_params)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+        today = timezone.localdate()
+        amounts, quantities = sales_totals(
+            company_id, min(window_start(today) for window_start, _ in TIMEFRAMES.values()), today)
+
+        return Response({
+            "summary": summary_counts(company_id),
+            "hourly_quantities": hourly_series(quantities),
+            "sales_by_timeframe": {timeframe: series(amounts, today)
+                                   for timeframe, (_, series) in TIMEFRAMES.items()},
+            "top_selling": top_selling_items(company_id, start_date, end_date),
+            "purchase_summary": purchase_summary(company_id, start_date, end_date),
+            "goals": GoalSerializer(filter_company(Goals.objects, company_id), many=True).data,
+        })
@@ -0,0 +1,279 @@
+from collections import defaultdict, namedtuple
+
+from django.db import connection
+from django.db.models import F, Q, Max, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from inventory_api.utils import movement_effect, MOVEMENT_EFFECTS
+
+from .lookup import invalidate_products
+from .models import Inventory, InventoryMovementItem, StockLedgerEntry, StockReservation, StockSnapshot
+
+# Signed units of a product added to a location ("store" or "warehouse") by the
+# invoice or movement with id reference_id
+StockChange = namedtuple("StockChange", ("inventory_id", "location", "quantity", "reference_id"))
+
+
+def lock_inventories(company_id, inventory_ids):
+    """
+    Locks the given inventory rows of the company with one SELECT ... FOR UPDATE.
+    Rows are always locked in primary key order so concurrent sales touching the
+    same products can't deadlock each other. Must run inside a transaction.
+    """
+    return {
+        inventory.id: inventory for inventory in
+        Inventory.objects.select_for_update().filter(company_id=company_id, pk__in=set(inventory_ids)).order_by("pk")
+    }
+
+
+def apply_stock_changes(company_id, source, changes):
+    """
+    Applies StockChange rows to the company's products with one conditional
+    ``UPDATE ... RETURNING``: the net store and warehouse delta of each product
+    is only written when neither counter goes below zero, and only the counter,
+    catalog version and updated_at columns are touched. Returns the ids of the
+    products that were not updated (not enough units or not found); when there
+    are any the caller must roll the transaction back. Updated products are
+    appended to the stock ledger under ``source``. Must run inside a transaction.
+    """
+    changes = [change for change in changes if change.quantity]
+    if not changes:
+        return []
+
+    deltas = defaultdict(lambda: [0, 0])
+    for change in changes:
+        deltas[change.inventory_id][0 if change.location == "store" else 1] += change.quantity
+
+    rows = sorted(deltas.items())
+    table = connection.ops.quote_name(Inventory._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH deltas (id, shops, storage) AS (VALUES {', '.join(['(%s, %s, %s)'] * len(rows))}) "
+            f"UPDATE {table} SET total_in_shops = {table}.total_in_shops + deltas.shops, "
+            f"total_in_storage = {table}.total_in_storage + deltas.storage, updated_at = %s, catalog_version = txid_current() "
+            f"FROM deltas WHERE {table}.id = deltas.id AND {table}.company_id = %s "
+            f"AND {table}.total_in_shops + deltas.shops >= 0 AND {table}.total_in_storage + deltas.storage >= 0 "
+            f"RETURNING {table}.id",
+            [value for inventory_id, (shops, storage) in rows for value in (inventory_id, shops, storage)] + [
+                connection.ops.adapt_datetimefield_value(timezone.now()), company_id]
+        )
+        updated = {row[0] for row in cursor.fetchall()}
+
+    failed = [inventory_id for inventory_id, _ in rows if inventory_id not in updated]
+    if failed:
+        return failed
+
+    invalidate_products(company_id, updated)
+
+    # Inserted after the UPDATE took the row locks, so entries are timestamped in lock order
+    StockLedgerEntry.objects.bulk_create([
+        StockLedgerEntry(inventory_id=change.inventory_id, location=change.location, quantity=change.quantity,
+                         source=source, reference_id=change.reference_id, company_id=company_id)
+        for change in changes
+    ])
+
+    return []
+
+
+def shortage_error(company_id, inventory_ids):
+    codes = Inventory.objects.filter(company_id=company_id, pk__in=inventory_ids).order_by("pk").values_list(
+        "code", flat=True)
+    return f"items with code {', '.join(codes)} does not have enough quantity"
+
+
+def movement_shortages(quantities, inventories, storage_units, shops_units):
+    """
+    Returns the ids of the products whose available warehouse or store units
+    (annotated by available_inventories) would go below zero after moving
+    ``quantities`` (units by inventory id).
+    """
+    return [inventory_id for inventory_id, quantity in quantities.items()
+            if inventories[inventory_id].available_in_storage + storage_units * quantity < 0
+            or inventories[inventory_id].available_in_shops + shops_units * quantity < 0]
+
+
+def available_inventories(company_id):
+    """
+    Company products annotated with available_in_shops / available_in_storage:
+    the counters minus the units reserved by pending movements.
+    """
+    return Inventory.objects.filter(company_id=company_id).annotate(
+        available_in_shops=F("total_in_shops") - Coalesce(
+            Sum("reservations__reserved", filter=Q(reservations__location="store")), 0),
+        available_in_storage=F("total_in_storage") - Coalesce(
+            Sum("reservations__reserved", filter=Q(reservations__location="warehouse")), 0),
+    )
+
+
+def reserve_movement_items(movement, movement_items, release=False):
+    """
+    Reserves (or releases) the units the pending (inventory id, quantity) lines
+    of a movement take from its origin, with one INSERT of the missing rows and
+    one conditional ``UPDATE ... RETURNING``: a reservation is only written when
+    the counter still covers every unit reserved at that location, so two
+    movements checked at the same time can't both take the last units. Raises
+    when any product falls short. Movements that only add units reserve
+    nothing. Must run inside a transaction.
+    """
+    storage_units, shops_units = MOVEMENT_EFFECTS.get(
+        (movement.event_type, movement.origin, movement.destination), (0, 0))
+    units = {"warehouse": storage_units, "store": shops_units}.get(movement.origin, 0)
+    if units >= 0:
+        return
+
+    deltas = defaultdict(int)
+    for inventory_id, quantity in movement_items:
+        deltas[int(inventory_id)] += -units * int(quantity) * (-1 if release else 1)
+    rows = sorted((inventory_id, delta) for inventory_id, delta in deltas.items() if delta)
+    if not rows:
+        return
+
+    StockReservation.objects.bulk_create([
+        StockReservation(inventory_id=inventory_id, location=movement.origin, company_id=movement.company_id)
+        for inventory_id, _ in rows
+    ], ignore_conflicts=True)
+
+    counter = "total_in_shops" if movement.origin == "store" else "total_in_storage"
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    inventory_table = connection.ops.quote_name(Inventory._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH deltas (id, delta) AS (VALUES {', '.join(['(%s, %s)'] * len(rows))}) "
+            f"UPDATE {table} SET reserved = {table}.reserved + deltas.delta, updated_at = %s "
+            f"FROM deltas, {inventory_table} WHERE {table}.inventory_id = deltas.id AND {table}.location = %s "
+            f"AND {inventory_table}.id = deltas.id "
+            f"AND (deltas.delta < 0 OR {inventory_table}.{counter} - {table}.reserved - deltas.delta >= 0) "
+            f"RETURNING {table}.inventory_id",
+            [value for row in rows for value in row] + [
+                connection.ops.adapt_datetimefield_value(timezone.now()), movement.origin]
+        )
+        updated = {row[0] for row in cursor.fetchall()}
+
+    failed = [inventory_id for inventory_id, _ in rows if inventory_id not in updated]
+    if failed:
+        raise Exception(shortage_error(movement.company_id, failed))
+
+
+def reserve_movement(movement, release=False):
+    """Reserves (or releases) every pending item of the movement, as stored."""
+    reserve_movement_items(movement, InventoryMovementItem.objects.filter(
+        inventory_movement=movement, state="pending").values_list("inventory_id", "quantity"), release)
+
+
+def movement_errors(company_id, event_type, origin, destination, movement_items):
+    """
+    Validates the lines of a pending movement against the units not reserved by
+    other pending movements, with one query for all its products. Returns one {"line", "inventory_id", "error"}
+    entry per offending line (an empty list when the movement can be approved).
+    """
+    storage_units, shops_units = movement_effect(event_type, origin, destination)
+
+    lines = []
+    errors = []
+    for line, item in enumerate(movement_items):
+        try:
+            inventory_id, quantity = int(item.get("inventory_id")), int(item.get("quantity"))
+        except (TypeError, ValueError):
+            errors.append({"line": line, "inventory_id": item.get("inventory_id"),
+                           "error": "El producto y la cantidad deben ser números"})
+            continue
+
+        if quantity <= 0:
+            errors.append({"line": line, "inventory_id": inventory_id, "error": "La cantidad debe ser mayor a cero"})
+            continue
+        lines.append((line, inventory_id, quantity))
+
+    inventories = available_inventories(company_id).in_bulk({inventory_id for _, inventory_id, _ in lines})
+
+    quantities = defaultdict(int)
+    for line, inventory_id, quantity in lines:
+        if inventory_id not in inventories:
+            errors.append({"line": line, "inventory_id": inventory_id, "error": "Producto no encontrado"})
+        else:
+            quantities[inventory_id] += quantity
+
+    shortages = set(movement_shortages(quantities, inventories, storage_units, shops_units))
+    errors += [{"line": line, "inventory_id": inventory_id,
+                "error": f"item with code {inventories[inventory_id].code} does not have enough quantity"}
+               for line, inventory_id, _ in lines if inventory_id in shortages]
+
+    return sorted(errors, key=lambda error: error["line"])
+
+
+def apply_movement_items(movement, movement_items, mode="approval"):
+    """
+    Approves (or, with mode="override", reverts) the (inventory id, quantity)
+    lines of a movement: the net warehouse and store deltas per product are
+    computed in memory and applied with one conditional UPDATE, which fails the
+    movement when a product doesn't have enough units. Approved lines release
+    their reservation. Must run inside a transaction.
+    """
+    storage_units, shops_units = movement_effect(movement.event_type, movement.origin, movement.destination, mode)
+
+    quantities = defaultdict(int)
+    for inventory_id, quantity in movement_items:
+        quantities[inventory_id] += quantity
+
+    inventories = Inventory.objects.filter(company_id=movement.company_id).only("id").in_bulk(quantities.keys())
+    missing = [str(inventory_id) for inventory_id in quantities if inventory_id not in inventories]
+    if missing:
+        raise Exception(f"Productos no encontrados: {', '.join(missing)}")
+
+    changes = []
+    for inventory_id, quantity in quantities.items():
+        changes.append(StockChange(inventory_id, "warehouse", storage_units * quantity, movement.id))
+        changes.append(StockChange(inventory_id, "store", shops_units * quantity, movement.id))
+
+    failed = apply_stock_changes(movement.company_id, "movement" if mode == "approval" else "override", changes)
+    if failed:
+        raise Exception(shortage_error(movement.company_id, failed))
+
+    if mode == "approval":
+        reserve_movement_items(movement, quantities.items(), release=True)
+
+
+def take_stock_snapshot(company_id):
+    """
+    Stores the current units of every product of the company. The rows are
+    locked before taking the time, so each ledger entry is either counted in the
+    snapshot or timestamped after it. Must run inside a transaction.
+    """
+    inventories = list(Inventory.objects.select_for_update().filter(company_id=company_id).order_by("pk")
+                       .values_list("id", "total_in_shops", "total_in_storage"))
+    taken_at = timezone.now()
+
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(inventory_id=inventory_id, total_in_shops=shops, total_in_storage=storage,
+                      taken_at=taken_at, company_id=company_id)
+        for inventory_id, shops, storage in inventories
+    ])
+
+    return taken_at, len(inventories)
+
+
+def stock_at(company_id, at, inventory_ids=None):
+    """
+    Returns {inventory id: (store units, warehouse units)} at the given time:
+    the latest snapshot taken up to then plus the ledger entries after it.
+    """
+    snapshots = StockSnapshot.objects.filter(company_id=company_id)
+    ledger = StockLedgerEntry.objects.filter(company_id=company_id, created_at__lte=at)
+    if inventory_ids is not None:
+        snapshots = snapshots.filter(inventory_id__in=inventory_ids)
+        ledger = ledger.filter(inventory_id__in=inventory_ids)
+
+    taken_at = snapshots.filter(taken_at__lte=at).aggregate(taken_at=Max("taken_at"))["taken_at"]
+
+    stock = defaultdict(lambda: [0, 0])
+    if taken_at is not None:
+        for inventory_id, shops, storage in snapshots.filter(taken_at=taken_at).values_list(
+                "inventory_id", "total_in_shops", "total_in_storage"):
+            stock[inventory_id] = [shops, storage]
+        ledger = ledger.filter(created_at__gt=taken_at)
+
+    for inventory_id, location, quantity in ledger.values("inventory_id", "location").annotate(
+            quantity=Sum("quantity")).values_list("inventory_id", "location", "quantity").order_by():
+        stock[inventory_id][0 if location == "store" else 1] += quantity
+
+    return {inventory_id: tuple(units) for inventory_id, units in stock.items()}
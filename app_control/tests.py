@@ -1,3 +1,50 @@
 from django.test import TestCase
 
-# Create your tests here.
+from user_control.models import Company
+from .models import Inventory, Invoice, InvoiceItem, PaymentMethod
+from .sales import commit_invoice_items, void_invoice_items
+
+
+class VoidInvoiceItemsTest(TestCase):
+
+    def setUp(self):
+        self.company = Company.objects.create(name="c", dian_token="t", nit="1")
+        self.products = [
+            Inventory.objects.create(company=self.company, code=f"P{i}", name=f"p{i}", total_in_shops=10,
+                                     selling_price=100, usd_price=1)
+            for i in range(3)
+        ]
+        self.invoice = Invoice.objects.create(invoice_number="1", company=self.company)
+        commit_invoice_items(self.invoice, [
+            {"item_id": product.id, "quantity": 1, "amount": amount, "usd_amount": 1, "discount": 0,
+             "is_gift": is_gift}
+            for product, amount, is_gift in zip(self.products, (300, 100, 50), (False, False, True))
+        ], self.company.id)
+        for name, paid_amount in (("cash", 150), ("creditCard", 250)):
+            PaymentMethod.objects.create(invoice=self.invoice, name=name, paid_amount=paid_amount, back_amount=0,
+                                         received_amount=paid_amount, company=self.company)
+
+    def line(self, product):
+        return InvoiceItem.objects.get(invoice=self.invoice, item=product).id
+
+    def paid_amounts(self):
+        return dict(PaymentMethod.objects.filter(invoice=self.invoice).values_list("name", "paid_amount"))
+
+    def test_partial_void_scales_payment_methods_to_the_amount_left(self):
+        void_invoice_items(self.invoice, [self.line(self.products[1])])
+
+        self.assertEqual(self.paid_amounts(), {"cash": 112.5, "creditCard": 187.5})
+        self.assertEqual(sum(self.paid_amounts().values()), 300)
+        self.assertFalse(Invoice.objects.get(pk=self.invoice.pk).is_override)
+
+    def test_voiding_a_gift_keeps_payment_methods(self):
+        void_invoice_items(self.invoice, [self.line(self.products[2])])
+
+        self.assertEqual(self.paid_amounts(), {"cash": 150, "creditCard": 250})
+
+    def test_voiding_every_line_voids_the_invoice(self):
+        void_invoice_items(self.invoice, [self.line(product) for product in self.products])
+
+        self.assertTrue(Invoice.objects.get(pk=self.invoice.pk).is_override)
+        self.assertEqual(self.paid_amounts(), {"cash": 150, "creditCard": 250})
+        self.assertEqual(Inventory.objects.get(pk=self.products[0].pk).total_in_shops, 10)
@@ -3,12 +3,13 @@ from django.urls import path, include
 from .reports import ReportExporter, InventoriesReportExporter, ItemsReportExporter, InvoicesReportExporter, \
     ElectronicInvoiceExporter
 from .stats import SummaryView, HourlySalesQuantities, SalesBySelectedTimeframeSummary, PurchaseView, SalePerformance, \
-    SalesByUsersView
+    SalesByUsersView, DashboardView
 from .views import (
     DianResolutionView, GoalView, InventoryView, InvoiceView,
     InventoryGroupView, InventoryCSVLoaderView, UpdateInvoiceView,
     PaymentTerminalView, ProviderView, CustomerView, InvoicePainterView, InvoiceSimpleListView,
-    InvoicePaymentMethodsView, UploadFileView, InventoryMovementView
+    InvoicePaymentMethodsView, UploadFileView, InventoryMovementView, InvoiceBatchView, CatalogView,
+    InventoryLookupView, StockAtView
 )
 
 from rest_framework.routers import DefaultRouter
@@ -36,6 +37,9 @@ urlpatterns = [
     path('update-invoice/<str:invoice_number>/',
          UpdateInvoiceView.as_view(), name='update-invoice'),
     path('provider/<int:pk>/', ProviderView.as_view({'put': 'update', 'delete': 'destroy'}), name='provider-detail'),
+    path('catalog', CatalogView.as_view(), name='catalog'),
+    path('inventory-lookup', InventoryLookupView.as_view(), name='inventory-lookup'),
+    path('stock-at', StockAtView.as_view(), name='stock-at'),
     path('inventory/<int:pk>/', InventoryView.as_view({'put': 'update', 'delete': 'destroy'}), name='inventory-detail'),
     path('payment-terminal/<int:pk>/', PaymentTerminalView.as_view({'put': 'update', 'delete': 'destroy'}),
          name='payment-terminal-detail'),
@@ -45,6 +49,7 @@ urlpatterns = [
          name='dian-resolution-detail'),
     path('group/<int:pk>/', InventoryGroupView.as_view({'put': 'update', 'delete': 'destroy'}), name='group-detail'),
     path('customer/<int:pk>/', CustomerView.as_view({'put': 'update', 'delete': 'destroy'}), name='customer-detail'),
+    path('invoice-batch/', InvoiceBatchView.as_view(), name='invoice-batch'),
     path('invoice/<int:pk>/', InvoiceView.as_view({'delete': 'destroy'}), name='invoice-detail'),
     path('product_sales_report_export/', ItemsReportExporter.as_view(), name='product_sales_report_export'),
     path('invoices_report_export/', InvoicesReportExporter.as_view(), name='invoices_report_export'),
@@ -53,6 +58,8 @@ urlpatterns = [
          InventoryView.as_view({'post': 'toggle_active'}), name='inventory-toggle'),
     path('inventory-movement/<int:pk>/change_state/<str:state>/',
          InventoryMovementView.as_view({'post': 'change_state'}), name='inventory-movement-change-state'),
+    path('inventory-movement/<int:pk>/job/',
+         InventoryMovementView.as_view({'get': 'job'}), name='inventory-movement-job'),
     path('inventory-movement/<int:pk>/change_state_item/<str:state>/',
          InventoryMovementView.as_view({'post': 'change_state_item'}), name='inventory-movement-change-state-item'),
     path('provider/<int:pk>/toggle-active/',
@@ -66,6 +73,7 @@ urlpatterns = [
     path('purchase-summary', PurchaseView.as_view({'post': 'purchase_data'}), name='purchase-summary'),
     path('top-selling', SalePerformance.as_view({'post': 'top_selling'}), name='top-selling'),
     path('sales-by-user', SalesByUsersView.as_view({'post': 'sales_by_user'}), name='sales-by-user'),
+    path('dashboard', DashboardView.as_view(), name='dashboard'),
     path('goals/<int:pk>/', GoalView.as_view({'put': 'update', 'delete': 'destroy'}), name='goal-detail'),
     path('update-payment-methods', InvoicePaymentMethodsView.as_view(), name='invoice-payment-methods'),
     path('upload-photo/', UploadFileView.as_view({'post': 'upload_photo'}), name='upload-photo')
@@ -1,30 +1,38 @@
-from datetime import date
+from datetime import date, datetime, time
 
-import boto3
-from django.db import transaction
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.db.models.functions.comparison import Coalesce
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
 
 from app_control.models import DianResolution, Goals, PaymentTerminal, Provider, PaymentMethod, InventoryMovement, \
-    InventoryMovementItem
+    InventoryMovementItem, MovementJob, CatalogTombstone, snapshot_version
 from inventory_api import settings
+from inventory_api.aws import get_aws_client
+from .idempotency import idempotent, store_response, batch_claim, batch_replay, store_batch_results
+from .jobs import queue_movement_job, has_active_job, MOVEMENT_IN_PROGRESS
+from .lookup import lookup_products, PRODUCT_FIELDS
+from .stock import apply_movement_items, movement_errors, reserve_movement, reserve_movement_items, stock_at
+from .sales import commit_invoices, check_payment_methods, replace_payment_methods, void_invoice_items
 
 from .serializers import (
     GoalSerializer, Inventory, InventorySerializer, InventoryGroupSerializer, InventoryGroup,
     Invoice, InvoiceSerializer, DianSerializer, PaymentTerminalSerializer, ProviderSerializer,
-    Customer, CustomerSerializer, InvoiceSimpleSerializer, InventoryMovementSerializer, InventoryMovementItemSerializer
+    Customer, CustomerSerializer, InvoiceSimpleSerializer, InventoryMovementSerializer, InventoryMovementItemSerializer,
+    MovementJobSerializer
 )
 from rest_framework.response import Response
 from rest_framework import status
 from inventory_api.custom_methods import IsAuthenticatedCustom
 
-from inventory_api.utils import CustomPagination, get_query, filter_company, manage_inventories
+from inventory_api.utils import CustomPagination, get_query, filter_company
 from django.db.models import Count, Sum, Q
 
 import csv
 import codecs
-from user_control.views import add_user_activity
+from user_control.views import add_user_activity, add_user_activities
 
 
 class InventoryView(ModelViewSet):
@@ -80,7 +88,7 @@ class InventoryView(ModelViewSet):
             return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
         inventory.active = not inventory.active
-        inventory.save()
+        inventory.save(update_fields=["active", "updated_at"])
 
         if inventory.active is False:
             add_user_activity(request.user, f"Desactivó el producto {inventory.code}")
@@ -181,6 +189,21 @@ class InventoryMovementView(ModelViewSet):
 
         return results.order_by('id')
 
+    def perform_create(self, serializer):
+        reserve_movement(serializer.save())
+
+    def check_movement_items(self, movement_items, origin, destination, event_type):
+        try:
+            errors = movement_errors(self.request.user.company_id, event_type, origin, destination, movement_items)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if errors:
+            return Response({"error": "; ".join(f"Línea {error['line'] + 1}: {error['error']}" for error in errors),
+                             "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         try:
             with transaction.atomic():
@@ -190,21 +213,18 @@ class InventoryMovementView(ModelViewSet):
                 if request.data.get("state") != "pending" and request.data.get("state") is not None:
                     raise Exception("El estado inicial del movimiento debe ser pendiente")
 
-                movement_items = request.data.get("inventory_movement_items")
-                for item in movement_items:
-                    inventory = Inventory.objects.filter(pk=item.get("inventory_id")).first()
-
-                    try:
-                        manage_inventories(inventory, item.get("quantity"),
-                                           request.data.get("origin"), request.data.get("destination"),
-                                           request.data.get("event_type"), mode="check")
-                    except Exception as e:
-                        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                response = self.check_movement_items(
+                    request.data.get("inventory_movement_items") or [], request.data.get("origin"),
+                    request.data.get("destination"), request.data.get("event_type"))
+                if response is not None:
+                    return response
 
                 add_user_activity(request.user,
                                   f"{request.user.fullname} creó un movimiento de inventario "
                                   f"de {request.data.get('event_type')}")
-                return super().create(request, *args, **kwargs)
+                response = super().create(request, *args, **kwargs)
+                store_response(request, response)
+                return response
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -221,27 +241,32 @@ class InventoryMovementView(ModelViewSet):
                     return Response({'error': 'Movimiento de inventario ya aprobado o rechazado'},
                                     status=status.HTTP_400_BAD_REQUEST)
 
+                if has_active_job(movement.id):
+                    return Response({'error': MOVEMENT_IN_PROGRESS}, status=status.HTTP_409_CONFLICT)
+
                 origin = request.data.get("origin")
                 destination = request.data.get("destination")
                 event_type = request.data.get("event_type")
                 movement_items = request.data.get("inventory_movement_items") if request.data.get("inventory_movement_items") \
                     else InventoryMovementItem.objects.filter(inventory_movement_id=movement.id).values()
 
-                for item in movement_items:
-                    inventory = Inventory.objects.filter(pk=item.get("inventory_id")).first()
-                    try:
-                        manage_inventories(inventory, item.get("quantity"),
-                                           origin, destination, event_type, mode="check")
-                    except Exception as e:
-                        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                # Checked against the units of the other movements, the reservation is taken again below
+                reserve_movement(movement, release=True)
+                response = self.check_movement_items(movement_items, origin, destination, event_type)
+                if response is not None:
+                    transaction.set_rollback(True)
+                    return response
 
                 serializer = self.serializer_class(movement, data=request.data)
                 if serializer.is_valid():
-                    serializer.save()
+                    reserve_movement(serializer.save())
+                    # The items were replaced, drop the ones prefetched by get_queryset
+                    movement._prefetched_objects_cache = {}
                     add_user_activity(request.user,
                                       f"{request.user.fullname} actualizó el movimiento de inventario "
                                       f"de {request.data.get('event_type')}")
                     return Response(serializer.data)
+                transaction.set_rollback(True)
                 return Response(serializer.errors, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -252,7 +277,13 @@ class InventoryMovementView(ModelViewSet):
         if movement is None:
             return Response({'error': 'Movimiento de inventario no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
-        movement.delete()
+        if has_active_job(movement.id):
+            return Response({'error': MOVEMENT_IN_PROGRESS}, status=status.HTTP_409_CONFLICT)
+
+        with transaction.atomic():
+            if movement.state == "pending":
+                reserve_movement(movement, release=True)
+            movement.delete()
         add_user_activity(request.user,
                           f"{request.user.fullname} eliminó el movimiento de inventario "
                           f"de {movement.event_type}")
@@ -262,76 +293,84 @@ class InventoryMovementView(ModelViewSet):
     def change_state(self, request, pk, state):
         try:
             with transaction.atomic():
-                movement = self.get_queryset().filter(pk=pk).first()
-                
+                movement = filter_company(InventoryMovement.objects.select_for_update(),
+                                          self.request.user.company_id).filter(pk=pk).first()
+
                 if state not in ["approve", "reject", "override"]:
                     return Response({'error': 'Tipo de acción no válida'}, status=status.HTTP_400_BAD_REQUEST)
 
                 if movement is None:
                     return Response({'error': 'Movimiento de inventario no encontrado'},
                                     status=status.HTTP_404_NOT_FOUND)
-                  
+
+                if has_active_job(movement.id):
+                    return Response({'error': MOVEMENT_IN_PROGRESS}, status=status.HTTP_409_CONFLICT)
+
                 if state == "approve":
-                    try:
-                        if movement.state != "pending":
-                            return Response({'error': 'Movimiento de inventario ya aprobado o rechazado'},
-                                            status=status.HTTP_400_BAD_REQUEST)
-
-                        movement_items = InventoryMovementItem.objects.filter(inventory_movement_id=movement.id,
-                                                                              state="pending").all()
-                        for item in movement_items:
-                            manage_inventories(item.inventory, item.quantity,
-                                               movement.origin, movement.destination, movement.event_type,
-                                               mode="approval")
-                            item.state = "approved"
-                            item.save()
-                    except Exception as e:
-                        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-                    movement.state = "approved"
-                    movement.save()
-                    serializer = self.serializer_class(movement)
-                    return Response(serializer.data)
+                    if movement.state != "pending":
+                        return Response({'error': 'Movimiento de inventario ya aprobado o rechazado'},
+                                        status=status.HTTP_400_BAD_REQUEST)
+
+                    new_state, items_state, mode = "approved", "pending", "approval"
                 elif state == "override":
                     if movement.state != "approved":
                         return Response({'error': 'Movimiento no aprobado, solo se puede invalidar movimientos aprobados'},
                                         status=status.HTTP_400_BAD_REQUEST)
 
-                    try:
-                        movement_items = InventoryMovementItem.objects.filter(inventory_movement_id=movement.id,
-                                                                              state="approved").all()
-                        for item in movement_items:
-                            if item.state != "approved":
-                                return Response(
-                                    {'error': 'Movimiento no aprobado, solo se puede invalidar movimientos aprobados'},
-                                    status=status.HTTP_400_BAD_REQUEST)
-                            manage_inventories(item.inventory, item.quantity,
-                                               movement.origin, movement.destination, movement.event_type,
-                                               mode="override")
-                            item.state = "overrided"
-                            item.save()
-                    except Exception as e:
-                        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-                    movement.state = "overrided"
-                    movement.save()
-                    serializer = self.serializer_class(movement)
-                    return Response(serializer.data)
+                    new_state, items_state, mode = "overrided", "approved", "override"
                 else:
                     if movement.state != "pending":
                         return Response({'error': 'Movimiento de inventario ya aprobado o rechazado'},
                                         status=status.HTTP_400_BAD_REQUEST)
+                    reserve_movement(movement, release=True)
                     movement.state = "rejected"
                     movement.save()
                     serializer = self.serializer_class(movement)
                     return Response(serializer.data)
+
+                if request.query_params.get("async") == "true":
+                    job = queue_movement_job(movement, state, request.user)
+                    add_user_activity(request.user,
+                                      f"{request.user.fullname} inició el procesamiento del movimiento de inventario "
+                                      f"de {movement.event_type}")
+                    return Response(MovementJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+                movement_items = InventoryMovementItem.objects.filter(inventory_movement_id=movement.id,
+                                                                      state=items_state)
+                try:
+                    apply_movement_items(movement, movement_items.values_list("inventory_id", "quantity"), mode)
+                except Exception as e:
+                    transaction.set_rollback(True)
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+                movement_items.update(state=new_state, updated_at=timezone.now())
+                movement.state = new_state
+                movement.save()
+                serializer = self.serializer_class(movement)
+                return Response(serializer.data)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def job(self, request, pk):
+        movement = self.get_queryset().filter(pk=pk).first()
+
+        if movement is None:
+            return Response({'error': 'Movimiento de inventario no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+        job = MovementJob.objects.filter(inventory_movement=movement).select_related("created_by").first()
+        if job is None:
+            return Response({'error': 'El movimiento no tiene procesos en segundo plano'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        # Read after the job, a finished job always shows the final state of the movement
+        movement.refresh_from_db(fields=["state"])
+        return Response({**MovementJobSerializer(job).data, "movement_state": movement.state})
+
     def change_state_item(self, request, pk, state):
         try:
             with transaction.atomic():
-                movement_item = InventoryMovementItem.objects.filter(pk=pk).first()
+                movement_item = filter_company(InventoryMovementItem.objects.select_for_update(),
+                                               self.request.user.company_id).filter(pk=pk).first()
 
                 if state not in ["approve", "reject", "override"]:
                     return Response({'error': 'Tipo de acción no válida'}, status=status.HTTP_400_BAD_REQUEST)
@@ -340,54 +379,147 @@ class InventoryMovementView(ModelViewSet):
                     return Response({'error': 'Producto de Movimiento no encontrado'},
                                     status=status.HTTP_404_NOT_FOUND)
 
-                movement = InventoryMovement.objects.filter(pk=movement_item.inventory.id, state="pending").first()
+                movement = movement_item.inventory_movement
+
+                if has_active_job(movement.id):
+                    return Response({'error': MOVEMENT_IN_PROGRESS}, status=status.HTTP_409_CONFLICT)
 
                 if state == "approve":
                     if movement_item.state != "pending" or movement.state != "pending":
                         return Response({'error': 'Movimiento de inventario ya aprobado o rechazado'},
                                         status=status.HTTP_400_BAD_REQUEST)
 
-                    try:
-                        manage_inventories(movement_item.inventory, movement_item.quantity,
-                                           movement.origin, movement.destination, movement.event_type,
-                                           mode="approval")
-                    except Exception as e:
-                        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-                    movement_item.state = "approved"
-                    movement_item.save()
-                    serializer = InventoryMovementItemSerializer(movement_item)
-                    return Response(serializer.data)
+                    new_state, mode = "approved", "approval"
                 elif state == "override":
                     if movement_item.state != "approved":
                         return Response({'error': 'Movimiento no aprobado, solo se puede invalidar movimientos aprobados'},
                                         status=status.HTTP_400_BAD_REQUEST)
 
-                    try:
-                        print("Overriding changes")
-                        manage_inventories(movement_item.inventory, movement_item.quantity,
-                                           movement.origin, movement.destination, movement.event_type,
-                                           mode="override")
-                    except Exception as e:
-                        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-                    movement_item.state = "overrided"
-                    movement_item.save()
-                    serializer = InventoryMovementItemSerializer(movement_item)
-                    return Response(serializer.data)
+                    new_state, mode = "overrided", "override"
                 else:
                     if movement_item.state != "pending" or movement.state != "pending":
                         return Response({'error': 'Movimiento de inventario ya aprobado o rechazado'},
                                         status=status.HTTP_400_BAD_REQUEST)
 
+                    reserve_movement_items(movement, [(movement_item.inventory_id, movement_item.quantity)],
+                                           release=True)
                     movement_item.state = "rejected"
                     movement_item.save()
                     serializer = InventoryMovementItemSerializer(movement_item)
                     return Response(serializer.data)
+
+                try:
+                    apply_movement_items(movement, [(movement_item.inventory_id, movement_item.quantity)], mode)
+                except Exception as e:
+                    transaction.set_rollback(True)
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+                movement_item.state = new_state
+                movement_item.save()
+                serializer = InventoryMovementItemSerializer(movement_item)
+                return Response(serializer.data)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class CatalogView(APIView):
+    """
+    Compact product catalog for POS terminals. Without ``since`` it returns every
+    product; with the ``version`` of a previous response it only returns the
+    products changed since it and the ids of the deleted ones (a product may be
+    sent again).
+    """
+    http_method_names = ('get',)
+    permission_classes = (IsAuthenticatedCustom,)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get("since", 0))
+        except ValueError:
+            return Response({"error": "La versión debe ser un número"}, status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+
+        # Read before the rows: changes from transactions still running are sent again on the next sync
+        version = snapshot_version()
+        if since > version:
+            # Not a version this server returned (e.g. from before versions were transaction ids)
+            since = 0
+
+        items = filter_company(Inventory.objects, company_id).filter(
+            catalog_version__gte=since).order_by("catalog_version", "id").values(*PRODUCT_FIELDS)
+        deleted = filter_company(CatalogTombstone.objects, company_id).filter(
+            catalog_version__gte=since).values_list("inventory_id", flat=True) if since else []
+
+        return Response({"version": version, "full": not since, "items": list(items), "deleted": list(deleted)})
+
+
+class InventoryLookupView(APIView):
+    """
+    Resolves scanned product codes: ?code=A or ?code=A&code=B (or ?codes=A,B).
+    Served from a per worker cache backed by the unique_code index: changes made
+    through another worker (stock included) can take PRODUCT_LOOKUP_CACHE_TTL
+    seconds to show up.
+    """
+    http_method_names = ('get',)
+    permission_classes = (IsAuthenticatedCustom,)
+
+    def get(self, request, *args, **kwargs):
+        codes = request.query_params.getlist("code")
+        codes += [code for code in request.query_params.get("codes", "").split(",") if code]
+        codes = list(dict.fromkeys(code.strip() for code in codes if code.strip()))
+
+        if not codes:
+            return Response({"error": "Debe ingresar al menos un código"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(codes) > settings.PRODUCT_LOOKUP_MAX_CODES:
+            return Response({"error": f"Puede consultar máximo {settings.PRODUCT_LOOKUP_MAX_CODES} códigos"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        products = lookup_products(request.user.company_id, codes)
+        return Response({"items": [products[code] for code in codes if code in products],
+                         "missing": [code for code in codes if code not in products]})
+
+
+class StockAtView(APIView):
+    """
+    Store and warehouse units of the products at a past time: ?date=2024-05-01
+    (end of that day) or ?date=2024-05-01T18:30, optionally only for ?code=A&code=B.
+    """
+    http_method_names = ('get',)
+    permission_classes = (IsAuthenticatedCustom,)
+
+    def get(self, request, *args, **kwargs):
+        value = request.query_params.get("date", "")
+        try:
+            at = parse_datetime(value)
+            if at is None and parse_date(value) is not None:
+                at = datetime.combine(parse_date(value), time.max)
+        except ValueError:
+            at = None
+
+        if at is None:
+            return Response({"error": "Debe ingresar una fecha válida"}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        inventories = filter_company(Inventory.objects, request.user.company_id)
+        codes = request.query_params.getlist("code")
+        if codes:
+            inventories = inventories.filter(code__in=codes)
+
+        products = list(inventories.order_by("id").values("id", "code", "name"))
+        stock = stock_at(request.user.company_id, at,
+                         [product["id"] for product in products] if codes else None)
+
+        items = []
+        for product in products:
+            total_in_shops, total_in_storage = stock.get(product["id"], (0, 0))
+            items.append({**product, "total_in_shops": total_in_shops, "total_in_storage": total_in_storage})
+
+        return Response({"date": at, "items": items})
+
+
 class CustomerView(ModelViewSet):
     http_method_names = ('get', 'post', 'put', 'delete')
     queryset = Customer.objects.select_related(
@@ -601,12 +733,21 @@ class InvoiceView(ModelViewSet):
     permission_classes = (IsAuthenticatedCustom,)
     pagination_class = CustomPagination
 
+    def is_compact(self):
+        return self.request.query_params.get("compact") in ("true", "1")
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "compact": self.is_compact()}
+
     def get_queryset(self):
         data = self.request.query_params.dict()
         data.pop("page", None)
+        data.pop("compact", None)
 
         keyword = data.pop("keyword", None)
-        results = filter_company(self.queryset, self.request.user.company_id).filter(**data)
+        queryset = Invoice.objects.prefetch_related("invoice_items", "payment_methods") if self.is_compact() \
+            else self.queryset
+        results = filter_company(queryset, self.request.user.company_id).filter(**data)
 
         if keyword:
             search_fields = (
@@ -617,39 +758,150 @@ class InvoiceView(ModelViewSet):
 
         return results
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         try:
-            with transaction.atomic():
-                request.data.update({"company_id": request.user.company_id})
-                dian_resolution = filter_company(DianResolution.objects, self.request.user.company_id).filter(
-                    active=True).first()
-                if not dian_resolution:
-                    raise Exception("Necesita una Resolución de la DIAN activa para crear facturas")
-
-                if not request.data.get("sale_by_id"):
-                    request.data.update({"sale_by_id": request.user.id})
-
-                request.data.update({"created_by_id": request.user.id})
+            request.data.update({"company_id": request.user.company_id})
+            dian_resolution_id = filter_company(DianResolution.objects, self.request.user.company_id).filter(
+                active=True).values_list("id", flat=True).first()
+            if not dian_resolution_id:
+                raise Exception("Necesita una Resolución de la DIAN activa para crear facturas")
 
-                new_current_number = dian_resolution.current_number + 1
-                dian_resolution_document_number = dian_resolution.id
-                dian_resolution.current_number = new_current_number
-                dian_resolution.save()
+            if not request.data.get("sale_by_id"):
+                request.data.update({"sale_by_id": request.user.id})
 
-                request.data.update(
-                    {"dian_resolution_id": dian_resolution_document_number, "invoice_number": new_current_number})
+            request.data.update({"created_by_id": request.user.id})
+            # Numbered by the serializer inside the sale transaction, once the sale is validated
+            request.data.update({"dian_resolution_id": dian_resolution_id})
 
+            with transaction.atomic():
                 invoice = super().create(request, *args, **kwargs)
 
                 add_user_activity(request.user,
-                                  f"Creó la factura {request.data.get('invoice_number')}")
+                                  f"Creó la factura {invoice.data.get('invoice_number')}")
 
-                return Response({"message": "Factura creada satisfactoriamente", "data": invoice.data},
-                                status=status.HTTP_201_CREATED)
+                response = Response({"message": "Factura creada satisfactoriamente", "data": invoice.data},
+                                    status=status.HTTP_201_CREATED)
+                store_response(request, response)
+                return response
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class InvoiceBatchView(APIView):
+    """
+    Stores the sales queued by a terminal while it was offline. Invoices are
+    validated one by one and committed in chunks of INVOICE_BATCH_CHUNK_SIZE, each
+    chunk with one numbering UPDATE and one transaction. An invoice sent with an
+    idempotency_key is stored once, a resend gets its first result. Returns a
+    result per invoice, in the order they were sent.
+    """
+    http_method_names = ('post',)
+    permission_classes = (IsAuthenticatedCustom,)
+
+    def post(self, request, *args, **kwargs):
+        invoices = request.data.get("invoices")
+        if not invoices or not isinstance(invoices, list):
+            return Response({"error": "Debe enviar la lista de facturas"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(invoices) > settings.INVOICE_BATCH_MAX_SIZE:
+            return Response({"error": f"Puede enviar máximo {settings.INVOICE_BATCH_MAX_SIZE} facturas por lote"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        dian_resolution_id = filter_company(DianResolution.objects, request.user.company_id).filter(
+            active=True).values_list("id", flat=True).first()
+        if not dian_resolution_id:
+            return Response({"error": "Necesita una Resolución de la DIAN activa para crear facturas"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+        results = [None] * len(invoices)
+        keys = set()
+        chunk_size = settings.INVOICE_BATCH_CHUNK_SIZE
+
+        for start in range(0, len(invoices), chunk_size):
+            chunk = []
+            for index in range(start, min(start + chunk_size, len(invoices))):
+                try:
+                    claim = batch_claim(request, invoices[index]) if isinstance(invoices[index], dict) else None
+                except Exception as e:
+                    results[index] = {"index": index, "error": str(e)}
+                    continue
+
+                if claim is not None:
+                    if claim[0] in keys:
+                        results[index] = {"index": index, "error": "La llave de idempotencia está repetida en el lote"}
+                        continue
+                    keys.add(claim[0])
+
+                    replayed = batch_replay(company_id, claim)
+                    if replayed is not None:
+                        results[index] = {"index": index, **replayed}
+                        continue
+
+                validated_data, error = self.validate_invoice(request, invoices[index])
+                if error:
+                    results[index] = {"index": index, "error": error}
+                else:
+                    chunk.append((index, validated_data, claim))
+
+            if not chunk:
+                continue
+
+            # Numbered inside the chunk transaction, only the sales accepted by the stock check take a number
+            try:
+                with transaction.atomic():
+                    committed = commit_invoices([data for _, data, _ in chunk], company_id, dian_resolution_id)
+                    store_batch_results(company_id, [
+                        (claim, {"id": invoice.id, "invoice_number": invoice.invoice_number})
+                        for (_, _, claim), (invoice, _) in zip(chunk, committed) if claim and invoice
+                    ])
+            except IntegrityError:
+                # Another batch committed one of the keys first, the rest of the chunk can be sent again
+                committed = [(None, "La factura no se guardó porque otro envío del lote estaba en curso, "
+                                    "envíela de nuevo")] * len(chunk)
+            except Exception as e:
+                committed = [(None, str(e))] * len(chunk)
+
+            for (index, _, claim), (invoice, error) in zip(chunk, committed):
+                # A concurrent batch may have committed the same invoice first
+                replayed = batch_replay(company_id, claim) if error and claim else None
+                if replayed is not None:
+                    results[index] = {"index": index, **replayed}
+                elif error:
+                    results[index] = {"index": index, "error": error}
+                else:
+                    results[index] = {"index": index, "id": invoice.id, "invoice_number": invoice.invoice_number}
+
+        failed = len([result for result in results if "error" in result])
+        replayed = len([result for result in results if result.get("replayed")])
+        created = len(results) - failed - replayed
+        if created:
+            add_user_activity(request.user, f"Sincronizó {created} facturas")
+
+        return Response({"created": created, "replayed": replayed, "failed": failed, "results": results},
+                        status=status.HTTP_200_OK)
+
+    @staticmethod
+    def validate_invoice(request, invoice):
+        if not isinstance(invoice, dict):
+            return None, "Factura inválida"
+
+        data = {"sale_by_id": request.user.id, **invoice,
+                "company_id": request.user.company_id, "created_by_id": request.user.id}
+        serializer = InvoiceSerializer(data=data)
+        if not serializer.is_valid():
+            return None, serializer.errors
+
+        if not serializer.validated_data["invoice_item_data"]:
+            return None, "You need to provide at least one Invoice item"
+
+        if not serializer.validated_data.get("payment_methods"):
+            return None, "You need to provide at least one Payment method"
+
+        return serializer.validated_data, None
+
+
 class InvoiceSimpleListView(ModelViewSet):
     http_method_names = ('get',)
     permission_classes = (IsAuthenticatedCustom,)
@@ -675,36 +927,44 @@ class InvoiceSimpleListView(ModelViewSet):
             results = results.filter(query)
 
         return results.annotate(
-            total_sum=Coalesce(Sum("invoice_items__amount", filter=Q(invoice_items__is_gift=False)), 0.0),
-            total_sum_usd=Coalesce(Sum("invoice_items__usd_amount", filter=Q(invoice_items__is_gift=False)), 0.0)
+            total_sum=Coalesce(Sum("invoice_items__amount", filter=Q(
+                invoice_items__is_gift=False, invoice_items__is_override=False)), 0.0),
+            total_sum_usd=Coalesce(Sum("invoice_items__usd_amount", filter=Q(
+                invoice_items__is_gift=False, invoice_items__is_override=False)), 0.0)
         ).order_by('-created_at')
 
 
 class UpdateInvoiceView(APIView):
     """
-    View to override an invoice
+    View to override an invoice, or only the lines given in invoice_item_ids
     """
     permission_classes = (IsAuthenticatedCustom,)
 
     def patch(self, request, invoice_number):
-        try:
-            invoice = filter_company(Invoice.objects, self.request.user.company_id).get(invoice_number=invoice_number)
-        except Invoice.DoesNotExist:
-            return Response({"error": "Factura no encontrada"}, status=status.HTTP_404_NOT_FOUND)
+        invoice_item_ids = request.data.get("invoice_item_ids", None)
+        if invoice_item_ids is not None and (not isinstance(invoice_item_ids, list) or not invoice_item_ids):
+            return Response({"error": "Debe ingresar los productos a anular"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if invoice.is_override:
-            return Response({"error": "La Factura ya está anulada"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                invoice = filter_company(Invoice.objects.select_for_update(), self.request.user.company_id).filter(
+                    invoice_number=invoice_number).first()
+                if invoice is None:
+                    return Response({"error": "Factura no encontrada"}, status=status.HTTP_404_NOT_FOUND)
 
-        invoice.is_override = True
+                if invoice.is_override:
+                    return Response({"error": "La Factura ya está anulada"}, status=status.HTTP_400_BAD_REQUEST)
 
-        for item in invoice.invoice_items.all():
-            inventory_item = item.item
-            inventory_item.total_in_shops += item.quantity
-            inventory_item.save()
+                voided = void_invoice_items(invoice, invoice_item_ids)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        invoice.save()
-        add_user_activity(request.user, f"Actualizó la factura {invoice.invoice_number}")
-        return Response({"message": "Factura actualizada satisfactoriamente"}, status=status.HTTP_200_OK)
+        if invoice_item_ids is None:
+            add_user_activity(request.user, f"Actualizó la factura {invoice.invoice_number}")
+        else:
+            add_user_activity(request.user, f"Anuló {len(voided)} productos de la factura {invoice.invoice_number}")
+        return Response({"message": "Factura actualizada satisfactoriamente", "is_override": invoice.is_override},
+                        status=status.HTTP_200_OK)
 
 
 class InvoicePainterView(ModelViewSet):
@@ -791,7 +1051,7 @@ class DianResolutionView(ModelViewSet):
 
         if current_resolution is not None and current_resolution.to_date < date.today():
             current_resolution.active = False
-            current_resolution.save()
+            current_resolution.save(update_fields=["active"])
 
         query_set = filter_company(self.queryset, self.request.user.company_id)
         data = self.request.query_params.dict()
@@ -861,7 +1121,8 @@ class DianResolutionView(ModelViewSet):
             raise Exception("No se puede activar una resolución despues de su fecha limite")
 
         resolution.active = not resolution.active
-        resolution.save()
+        # Never writes a stale current_number back over the numbers taken meanwhile
+        resolution.save(update_fields=["active"])
         serializer = self.serializer_class(resolution)
 
         if resolution.active == True:
@@ -934,59 +1195,49 @@ class GoalView(ModelViewSet):
 
 
 class InvoicePaymentMethodsView(APIView):
+    """
+    Replaces the payment methods of the invoice given by the invoice_id query
+    param or, with an ``invoices`` list in the body, of several invoices at once.
+    """
     http_method_names = ('post',)
     permission_classes = (IsAuthenticatedCustom,)
+    invoice_fields = ("payment_methods", "payment_terminal_id", "is_dollar")
 
     def post(self, request, *args, **kwargs):
         try:
-            with transaction.atomic():
-                request.data.update({"company_id": request.user.company_id})
-                invoice_id = request.GET.get('invoice_id', None)
-
-                invoice = filter_company(Invoice.objects, self.request.user.company_id).filter(id=invoice_id).first()
-                if invoice is None:
+            if "invoices" in request.data:
+                changes = request.data.get("invoices")
+                if not changes or not isinstance(changes, list):
+                    raise Exception("Debe enviar la lista de facturas")
+            else:
+                changes = [{"invoice_id": request.GET.get('invoice_id', None),
+                            **{name: request.data.get(name) for name in self.invoice_fields if name in request.data}}]
+
+            changes_by_invoice = {}
+            for change in changes:
+                try:
+                    invoice_id = int(change.get("invoice_id"))
+                except (TypeError, ValueError):
                     raise Exception("Factura no encontrada")
 
-                old_payment_methods = []
+                check_payment_methods(change.get("payment_methods", None))
+                changes_by_invoice[invoice_id] = {name: change[name] for name in self.invoice_fields if name in change}
 
-                for query in invoice.payment_methods.all():
-                    old_payment_methods.append(query.name)
+            invoice_ids = set(filter_company(Invoice.objects, self.request.user.company_id).filter(
+                id__in=changes_by_invoice.keys()).values_list("id", flat=True))
+            missing = [str(invoice_id) for invoice_id in changes_by_invoice if invoice_id not in invoice_ids]
+            if missing:
+                raise Exception("Factura no encontrada" if len(changes_by_invoice) == 1
+                                else f"Facturas no encontradas: {', '.join(missing)}")
 
-                invoice.payment_methods.all().delete()
-
-                payment_methods = request.data.get("payment_methods", None)
-                if not payment_methods:
-                    raise Exception("Debe ingresar los métodos de pago")
-
-                for method in payment_methods:
-                    if (method.get("name") is None or method.get("paid_amount") is None or method.get(
-                            "back_amount") is None or method.get("received_amount") is None):
-                        raise Exception(
-                            "Los métodos de pago deben tener nombre, monto pagado, monto de vuelto y monto recibido")
-
-                new_payment_methods = []
-                for method in payment_methods:
-                    PaymentMethod.objects.create(
-                        invoice_id=invoice_id,
-                        name=method.get("name"),
-                        paid_amount=method.get("paid_amount"),
-                        back_amount=method.get("back_amount"),
-                        received_amount=method.get("received_amount"),
-                        transaction_code=method.get("transaction_code", None),
-                        company_id=request.user.company_id
-                    )
-                    new_payment_methods.append(method.get("name"))
-
-                add_user_activity(request.user,
-                                  f"Actualizó los métodos de pago '{old_payment_methods}' a '{new_payment_methods}'")
-
-                if 'payment_terminal_id' in request.data:
-                    invoice.payment_terminal_id = request.data.get("payment_terminal_id", None)
-                    invoice.save()
+            with transaction.atomic():
+                old_payment_methods = replace_payment_methods(changes_by_invoice, request.user.company_id)
 
-                if 'is_dollar' in request.data:
-                    invoice.is_dollar = request.data.get("is_dollar", None)
-                    invoice.save()
+                add_user_activities(request.user, [
+                    f"Actualizó los métodos de pago '{old_payment_methods[invoice_id]}' a "
+                    f"'{[method.get('name') for method in change['payment_methods']]}'"
+                    for invoice_id, change in changes_by_invoice.items()
+                ])
 
                 return Response(
                     {"message": "Métodos de pago actualizados satisfactoriamente"},
@@ -1008,16 +1259,7 @@ class UploadFileView(ModelViewSet):
             )
 
         bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        aws_access_key = settings.AWS_ACCESS_KEY_ID
-        aws_secret_key = settings.AWS_SECRET_ACCESS_KEY
-        aws_region = settings.AWS_REGION_NAME
-
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=aws_region
-        )
+        s3 = get_aws_client("s3")
 
         try:
             response = s3.generate_presigned_post(
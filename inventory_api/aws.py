@@ -0,0 +1,89 @@
+import threading
+
+from django.conf import settings
+
+# Per service botocore options. Clients are shared by every request thread of a
+# worker, so the connection pool must be at least as large as the thread count.
+CLIENT_OPTIONS = {
+    "cognito-idp": {
+        "retries": {
+            "max_attempts": 5,
+            "mode": "adaptive"
+        },
+        "connect_timeout": 5,
+        "read_timeout": 10
+    },
+    "ses": {
+        "retries": {
+            "max_attempts": 3,
+            "mode": "standard"
+        }
+    },
+    "s3": {
+        "retries": {
+            "max_attempts": 3,
+            "mode": "standard"
+        }
+    },
+}
+
+
+class AWSClientRegistry:
+    """
+    Process wide registry of AWS clients. Each client is built on first use and
+    reused afterwards, which avoids paying credential and endpoint resolution on
+    every request. With AWS_BACKEND = "stub" the registry hands out in-process
+    fakes from inventory_api.aws_stub instead, so the app runs without AWS.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._session = None
+        self._lock = threading.Lock()
+
+    def get(self, service_name):
+        client = self._clients.get(service_name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(service_name)
+                if client is None:
+                    client = self._build(service_name)
+                    self._clients[service_name] = client
+        return client
+
+    def reset(self):
+        with self._lock:
+            self._clients = {}
+            self._session = None
+
+    def _build(self, service_name):
+        if service_name == "cognito-idp" and settings.COGNITO_BACKEND == "local":
+            from user_control.local_cognito import LocalCognitoClient
+            return LocalCognitoClient()
+
+        if settings.AWS_BACKEND == "stub":
+            from inventory_api.aws_stub import build_stub_client
+            return build_stub_client(service_name)
+
+        import boto3
+        from botocore.config import Config
+
+        if self._session is None:
+            self._session = boto3.session.Session(
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                region_name=settings.AWS_REGION_NAME
+            )
+
+        config = Config(
+            max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+            **CLIENT_OPTIONS.get(service_name, {})
+        )
+        return self._session.client(service_name, config=config)
+
+
+aws_clients = AWSClientRegistry()
+
+
+def get_aws_client(service_name):
+    return aws_clients.get(service_name)
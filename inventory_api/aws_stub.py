@@ -0,0 +1,185 @@
+import secrets
+import threading
+import uuid
+from types import SimpleNamespace
+
+from django.conf import settings
+
+
+class StubClientError(Exception):
+    pass
+
+
+def _exceptions(*names):
+    return SimpleNamespace(**{name: type(name, (StubClientError,), {}) for name in names})
+
+
+class StubCognitoClient:
+    """
+    In-memory user pool implementing the subset of the cognito-idp API used by
+    user_control.cognito_utils. State lives in the worker process only.
+    """
+
+    exceptions = _exceptions(
+        "UsernameExistsException", "NotAuthorizedException", "UserNotConfirmedException",
+        "UserNotFoundException", "InvalidPasswordException", "LimitExceededException",
+        "CodeMismatchException", "ExpiredCodeException"
+    )
+
+    def __init__(self):
+        self.users = {}
+        self.sessions = {}
+        self.access_tokens = {}
+        self.reset_codes = {}
+        self._lock = threading.Lock()
+
+    def _get_user(self, username):
+        user = self.users.get(username)
+        if user is None:
+            raise self.exceptions.UserNotFoundException(f"User {username} does not exist")
+        return user
+
+    def _user_from_token(self, access_token):
+        username = self.access_tokens.get(access_token)
+        if username is None:
+            raise self.exceptions.NotAuthorizedException("Invalid Access Token")
+        return self._get_user(username)
+
+    def _check_password(self, password):
+        if not password or len(password) < 8:
+            raise self.exceptions.InvalidPasswordException("Password does not conform to policy")
+
+    def _issue_tokens(self, user):
+        access_token = secrets.token_urlsafe(32)
+        self.access_tokens[access_token] = user["username"]
+        return {
+            "AccessToken": access_token,
+            "IdToken": secrets.token_urlsafe(32),
+            "RefreshToken": secrets.token_urlsafe(32),
+            "ExpiresIn": 3600,
+            "TokenType": "Bearer"
+        }
+
+    def admin_create_user(self, UserPoolId, Username, UserAttributes=(), **kwargs):
+        with self._lock:
+            if Username in self.users:
+                raise self.exceptions.UsernameExistsException("User account already exists")
+
+            attributes = {attr["Name"]: attr["Value"] for attr in UserAttributes}
+            attributes["sub"] = str(uuid.uuid4())
+            self.users[Username] = {
+                "username": Username,
+                "attributes": attributes,
+                "password": None,
+                "status": "FORCE_CHANGE_PASSWORD"
+            }
+        return {"User": {"Username": Username, "UserStatus": "FORCE_CHANGE_PASSWORD"}}
+
+    def admin_get_user(self, UserPoolId, Username, **kwargs):
+        user = self._get_user(Username)
+        return {
+            "Username": Username,
+            "UserStatus": user["status"],
+            "UserAttributes": [{"Name": name, "Value": value} for name, value in user["attributes"].items()]
+        }
+
+    def admin_initiate_auth(self, UserPoolId, ClientId, AuthFlow, AuthParameters, **kwargs):
+        user = self._get_user(AuthParameters.get("USERNAME"))
+
+        if user["status"] == "FORCE_CHANGE_PASSWORD":
+            session = secrets.token_urlsafe(32)
+            self.sessions[session] = user["username"]
+            return {"ChallengeName": "NEW_PASSWORD_REQUIRED", "Session": session, "ChallengeParameters": {}}
+
+        if user["password"] != AuthParameters.get("PASSWORD"):
+            raise self.exceptions.NotAuthorizedException("Incorrect username or password.")
+
+        return {"AuthenticationResult": self._issue_tokens(user)}
+
+    def respond_to_auth_challenge(self, ClientId, ChallengeName, ChallengeResponses, Session, **kwargs):
+        username = self.sessions.pop(Session, None)
+        if username is None or username != ChallengeResponses.get("USERNAME"):
+            raise self.exceptions.NotAuthorizedException("Invalid session for the user.")
+
+        new_password = ChallengeResponses.get("NEW_PASSWORD")
+        self._check_password(new_password)
+
+        user = self._get_user(username)
+        user["password"] = new_password
+        user["status"] = "CONFIRMED"
+        return {"AuthenticationResult": self._issue_tokens(user)}
+
+    def change_password(self, AccessToken, PreviousPassword, ProposedPassword, **kwargs):
+        user = self._user_from_token(AccessToken)
+        if user["password"] != PreviousPassword:
+            raise self.exceptions.NotAuthorizedException("Incorrect username or password.")
+
+        self._check_password(ProposedPassword)
+        user["password"] = ProposedPassword
+        return {}
+
+    def forgot_password(self, ClientId, Username, **kwargs):
+        self._get_user(Username)
+        self.reset_codes[Username] = f"{secrets.randbelow(10 ** 6):06d}"
+        return {"CodeDeliveryDetails": {"DeliveryMedium": "EMAIL", "AttributeName": "email"}}
+
+    def confirm_forgot_password(self, ClientId, Username, ConfirmationCode, Password, **kwargs):
+        user = self._get_user(Username)
+        if self.reset_codes.get(Username) != ConfirmationCode:
+            raise self.exceptions.CodeMismatchException("Invalid verification code provided.")
+
+        self._check_password(Password)
+        self.reset_codes.pop(Username)
+        user["password"] = Password
+        user["status"] = "CONFIRMED"
+        return {}
+
+    def get_user_attribute_verification_code(self, AccessToken, AttributeName, **kwargs):
+        self._user_from_token(AccessToken)
+        return {"CodeDeliveryDetails": {"DeliveryMedium": "EMAIL", "AttributeName": AttributeName}}
+
+    def verify_user_attribute(self, AccessToken, AttributeName, Code, **kwargs):
+        user = self._user_from_token(AccessToken)
+        user["attributes"][f"{AttributeName}_verified"] = "true"
+        return {}
+
+
+class StubSESClient:
+    exceptions = _exceptions("MessageRejected")
+
+    def __init__(self):
+        self.sent_messages = []
+
+    def send_email(self, **kwargs):
+        message_id = str(uuid.uuid4())
+        self.sent_messages.append({"MessageId": message_id, **kwargs})
+        return {"MessageId": message_id}
+
+
+class StubS3Client:
+    exceptions = _exceptions("NoSuchBucket", "NoSuchKey")
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        return {
+            "url": f"{settings.AWS_STUB_S3_URL.rstrip('/')}/{Bucket}/",
+            "fields": {
+                **(Fields or {}),
+                "key": Key,
+                "policy": secrets.token_urlsafe(16),
+                "x-amz-signature": secrets.token_hex(32)
+            }
+        }
+
+
+STUB_CLIENTS = {
+    "cognito-idp": StubCognitoClient,
+    "ses": StubSESClient,
+    "s3": StubS3Client,
+}
+
+
+def build_stub_client(service_name):
+    try:
+        return STUB_CLIENTS[service_name]()
+    except KeyError:
+        raise Exception(f"No hay un cliente de prueba para el servicio AWS '{service_name}'")
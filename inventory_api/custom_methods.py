@@ -1,10 +1,40 @@
+import copy
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
-from user_control.cognito_utils import validate_token
+from inventory_api.caching import TTLCache
+from inventory_api.server_timing import measure
+from user_control.cognito_utils import get_verified_claims
 from user_control.models import CustomUser
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 
+# Users resolved by Cognito sub, kept per worker process. Saves on CustomUser and
+# Company invalidate entries locally (see user_control.signals); the TTL bounds how
+# long other workers can serve a stale copy.
+authenticated_users = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def get_user_by_sub(sub):
+    user = authenticated_users.get(sub)
+
+    if user is None:
+        user = CustomUser.objects.select_related("company").filter(sub=sub).first()
+        if not user:
+            return None
+        authenticated_users.set(sub, user)
+
+    # Each request gets its own instance (company included) so views can modify and save it freely
+    return copy.deepcopy(user)
+
+
+def invalidate_user_cache(sub=None, company_id=None):
+    if sub is not None:
+        authenticated_users.delete(sub)
+    if company_id is not None:
+        authenticated_users.delete_many(lambda _, user: user.company_id == company_id)
+
 
 class IsAuthenticatedCustom(BasePermission):
 
@@ -18,8 +48,9 @@ class IsAuthenticatedCustom(BasePermission):
             return False
 
         token = auth_token.split(" ")[1] if auth_token.startswith("Bearer ") else None
-        user_data = validate_token(token)
-        user = CustomUser.objects.all().filter(sub=user_data['sub']).first()
+        with measure("auth"):
+            user_data = get_verified_claims(token)
+            user = get_user_by_sub(user_data['sub'])
 
         if not user:
             return False
@@ -1,6 +1,8 @@
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
 
+from inventory_api.server_timing import timed
+
 
 def add_values_to_col_multiple_rows(
         column,
@@ -53,3 +55,8 @@ def sum_formula_text(
         end_column,
 ):
     return f"=SUM({get_column_letter(start_column)}{start_row}:{get_column_letter(end_column)}{end_row})"
+
+
+@timed("excel")
+def save_workbook(wb, response):
+    wb.save(response)
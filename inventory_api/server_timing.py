@@ -0,0 +1,119 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+_local = threading.local()
+
+
+class ServerTiming:
+    """
+    Timings collected while handling one request. DB time is counted through a
+    connection execute wrapper; named sections are added with ``measure``.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.db_time = 0.0
+        self.query_count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+
+    def add(self, name, elapsed, db_elapsed=0.0):
+        total, db_total = self.sections.get(name, (0.0, 0.0))
+        self.sections[name] = (total + elapsed, db_total + db_elapsed)
+
+    def header(self, total):
+        metrics = []
+        app_time = total - self.db_time
+
+        for name, (elapsed, db_elapsed) in self.sections.items():
+            metrics.append(f"{name};dur={elapsed * 1000:.1f}")
+            app_time -= elapsed - db_elapsed
+
+        metrics.append(f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries"')
+        metrics.append(f'app;dur={max(app_time, 0) * 1000:.1f};desc="view and serialization"')
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+def current_timing():
+    return getattr(_local, "timing", None)
+
+
+@contextmanager
+def measure(name, exclude_db=False):
+    """
+    Adds the time spent in the block to the ``name`` section of the current
+    request. With ``exclude_db`` the SQL run inside the block is left out of the
+    section so it is only reported under ``db``. Does nothing when timing is off.
+    """
+    timing = current_timing()
+    if timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    db_start = timing.db_time
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        db_elapsed = timing.db_time - db_start
+        if exclude_db:
+            timing.add(name, elapsed - db_elapsed)
+        else:
+            timing.add(name, elapsed, db_elapsed)
+
+
+def timed(name, exclude_db=False):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure(name, exclude_db=exclude_db):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header with auth, db (time and query count), render,
+    excel and the remaining view/serialization time. Enabled with SERVER_TIMING.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = ServerTiming()
+        _local.timing = timing
+        start = time.perf_counter()
+
+        try:
+            with connection.execute_wrapper(timing):
+                response = self.get_response(request)
+        finally:
+            _local.timing = None
+
+        response["Server-Timing"] = timing.header(time.perf_counter() - start)
+        return response
+
+
+class TimedJSONRenderer(JSONRenderer):
+    @timed("render")
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context)
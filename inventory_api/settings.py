@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 import dj_database_url
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -33,8 +34,15 @@ AUTH_USER_MODEL = 'user_control.CustomUser'
 
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'inventory_api.custom_methods.custom_exception_handler',
+    'DEFAULT_RENDERER_CLASSES': [
+        'inventory_api.server_timing.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Adds a Server-Timing header (auth, db, render, excel, app) to every response
+SERVER_TIMING = config('SERVER_TIMING', default=False, cast=bool)
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -53,6 +61,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'inventory_api.server_timing.ServerTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,7 +73,9 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 
-CORS_EXPOSE_HEADERS = ['Content-Disposition']
+CORS_ALLOW_HEADERS = [*default_headers, 'idempotency-key']
+
+CORS_EXPOSE_HEADERS = ['Content-Disposition', 'Server-Timing', 'Idempotent-Replayed']
 
 ROOT_URLCONF = 'inventory_api.urls'
 
@@ -105,9 +116,28 @@ AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_REGION_NAME = config('AWS_REGION_NAME')
+# "aws" talks to AWS, "stub" swaps every client for the in-process fakes in inventory_api.aws_stub
+AWS_BACKEND = config('AWS_BACKEND', default='aws')
+AWS_MAX_POOL_CONNECTIONS = config('AWS_MAX_POOL_CONNECTIONS', default=20, cast=int)
+AWS_STUB_S3_URL = config('AWS_STUB_S3_URL', default='http://localhost:8000/stub-s3/')
 USER_POOL_ID = config('USER_POOL_ID')
 CLIENT_ID = config('CLIENT_ID')
 COGNITO_PUBLIC_KEYS_URL = config('COGNITO_PUBLIC_KEYS_URL')
+# "local" replaces the user pool with user_control.local_cognito: tokens are signed in process
+COGNITO_BACKEND = config('COGNITO_BACKEND', default='aws')
+# Private key file shared by the workers of the local issuer, required by the local backend (created 0600)
+LOCAL_COGNITO_KEY_FILE = config('LOCAL_COGNITO_KEY_FILE', default=None)
+# Password accepted for every database user by the local issuer, required by the local backend
+LOCAL_COGNITO_PASSWORD = config('LOCAL_COGNITO_PASSWORD', default=None)
+# Local JWKS document used instead of COGNITO_PUBLIC_KEYS_URL (offline startup and tests)
+COGNITO_JWKS_FILE = config('COGNITO_JWKS_FILE', default=None)
+# Seconds before the cached Cognito public keys are fetched again
+COGNITO_JWKS_TTL = config('COGNITO_JWKS_TTL', default=3600, cast=int)
+# Max verified access tokens memoized per worker process (0 disables the cache)
+VERIFIED_CLAIMS_CACHE_SIZE = config('VERIFIED_CLAIMS_CACHE_SIZE', default=2048, cast=int)
+# Users (with their company) resolved from the token sub, cached per worker process
+USER_CACHE_SIZE = config('USER_CACHE_SIZE', default=1024, cast=int)
+USER_CACHE_TTL = config('USER_CACHE_TTL', default=60, cast=int)
 CLIENT_SECRET = config('CLIENT_SECRET')
 
 # Password validation
@@ -156,3 +186,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Static Files Cache
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Invoicing
+
+# Offline sales accepted per batch request, and committed per transaction
+INVOICE_BATCH_MAX_SIZE = config('INVOICE_BATCH_MAX_SIZE', default=500, cast=int)
+INVOICE_BATCH_CHUNK_SIZE = config('INVOICE_BATCH_CHUNK_SIZE', default=50, cast=int)
+# Seconds an Idempotency-Key is honored, and completed keys remembered per worker process
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+IDEMPOTENCY_CACHE_SIZE = config('IDEMPOTENCY_CACHE_SIZE', default=1024, cast=int)
+
+# Catalog
+
+# Products resolved by code cached per worker process, seconds before changes from other workers are seen
+PRODUCT_LOOKUP_CACHE_SIZE = config('PRODUCT_LOOKUP_CACHE_SIZE', default=4096, cast=int)
+PRODUCT_LOOKUP_CACHE_TTL = config('PRODUCT_LOOKUP_CACHE_TTL', default=30, cast=int)
+PRODUCT_LOOKUP_MAX_CODES = config('PRODUCT_LOOKUP_MAX_CODES', default=100, cast=int)
+
+# Inventory movements
+
+# Threads per worker process running background movement approvals (?async=true), and items per transaction
+MOVEMENT_JOB_WORKERS = config('MOVEMENT_JOB_WORKERS', default=2, cast=int)
+MOVEMENT_JOB_CHUNK_SIZE = config('MOVEMENT_JOB_CHUNK_SIZE', default=500, cast=int)
+# Seconds without progress after which a job is taken as abandoned by a stopped worker
+MOVEMENT_JOB_STALE_SECONDS = config('MOVEMENT_JOB_STALE_SECONDS', default=300, cast=int)
+
+# Stats
+
+# Cache backend of the stats responses, e.g. django.core.cache.backends.filebased.FileBasedCache with a directory
+STATS_CACHE_BACKEND = config('STATS_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+STATS_CACHE_LOCATION = config('STATS_CACHE_LOCATION', default='stats')
+# Seconds a cached stats response is kept; sales invalidate it right away, users and goals only after this
+STATS_CACHE_TTL = config('STATS_CACHE_TTL', default=300, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stats': {
+        'BACKEND': STATS_CACHE_BACKEND,
+        'LOCATION': STATS_CACHE_LOCATION,
+        'TIMEOUT': STATS_CACHE_TTL,
+    },
+}
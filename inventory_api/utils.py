@@ -6,6 +6,7 @@ from openpyxl.utils import get_column_letter
 
 from inventory_api.excel_manager import add_values_to_row_multiple_columns, apply_styles_to_cells, sum_formula_text, \
     add_values_to_col_multiple_rows
+from inventory_api.server_timing import timed
 from user_control.models import CustomUser
 from rest_framework.pagination import PageNumberPagination
 import re
@@ -101,6 +102,7 @@ def filter_company(queryset, company_id):
     return queryset.filter(company_id=company_id)
 
 
+@timed("excel", exclude_db=True)
 def create_terminals_report(ws, report_data, start_date, end_date):
     if not report_data:
         return 3
@@ -185,6 +187,7 @@ def create_terminals_report(ws, report_data, start_date, end_date):
     return new_created_rows[-1] + 2
 
 
+@timed("excel", exclude_db=True)
 def create_dollars_report(ws, report_data, last_row, start_date, end_date):
     if not report_data:
         return last_row + 1
@@ -256,6 +259,7 @@ def create_dollars_report(ws, report_data, last_row, start_date, end_date):
     return beginning_row + 6
 
 
+@timed("excel", exclude_db=True)
 def create_cash_report(ws, last_row, last_row_cards, report_data, dollar_report_data, cards_report_data,
                        transfers_report_data, start_date, end_date):
     if not report_data:
@@ -382,6 +386,7 @@ def create_cash_report(ws, last_row, last_row_cards, report_data, dollar_report_
     return beginning_row + 13, second_row_text.index("TOTAL DIA") + 1
 
 
+@timed("excel", exclude_db=True)
 def create_inventory_report(ws, report_data):
     row_titles = ["CATEGORIA", "GRUPO", "CODIGO", "NOMBRE", "CANTIDAD BODEGA", "CANTIDAD TIENDA", "COSTO UNIDAD",
                   "VALOR VENTA UNIDAD",
@@ -403,6 +408,7 @@ def create_inventory_report(ws, report_data):
             ws[f"{get_column_letter(column)}{row}"].number_format = '_($* #,##0.00_);_($* (#,##0.00);_($* "-"??_);_(@_)'
 
 
+@timed("excel", exclude_db=True)
 def create_product_sales_report(ws, report_data, report_data_nulled, report_data_gifts,
                                 start_date, end_date, company):
     ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=3)
@@ -482,6 +488,7 @@ def create_product_sales_report(ws, report_data, report_data_nulled, report_data
                               font=headers_font, alignment=None, fill=None, border=None)
 
 
+@timed("excel", exclude_db=True)
 def create_invoices_report(ws, report_data):
     row_titles = ["FECHA", "VENDEDOR", "NUMERO DE FACTURA", "DOCUMENTO DIAN", "DATAFONO", "TOTAL", "ID CLIENTE",
                   "NOMBRE CLIENTE", "EMAIL CLIENTE", "TELEFONO CLIENTE", "DIRECCION CLIENTE"]
@@ -500,6 +507,7 @@ def create_invoices_report(ws, report_data):
         ws[f"{get_column_letter(6)}{row}"].number_format = '_($* #,##0.00_);_($* (#,##0.00);_($* "-"??_);_(@_)'
 
 
+@timed("excel", exclude_db=True)
 def electronic_invoice_report(ws, report_data):
     column_titles = ["Empresa", "Tipo Documento", "prefijo", "DocumentoNúmero", "Fecha", "Tercero Interno",
                      "Tercero Externo", "Nota",
@@ -535,6 +543,7 @@ def electronic_invoice_report(ws, report_data):
         cell.number_format = '0.00'
 
 
+@timed("excel", exclude_db=True)
 def clients_report(ws, report_data):
     column_titles = ["Tipo Identificación", "No. Identificación", "Ciudad Identificación",
                      "1er. Nombre o Razón Social ", "2do. Nombre", "1re. Apellido", "2do.Apellido", "Propiedad Activa",
@@ -563,6 +572,7 @@ def clients_report(ws, report_data):
             cell.number_format = "DD/MM/YYYY"
 
 
+@timed("excel", exclude_db=True)
 def electronic_invoice_report_by_invoice(ws, payment_methods_data, amount_data):
     column_titles = ["Detalle del Pago : Número de documento ",
                      "Detalle del Pago: Forma de Pago",
@@ -596,23 +606,27 @@ def electronic_invoice_report_by_invoice(ws, payment_methods_data, amount_data):
     ws.delete_cols(3, 2)
 
 
-def manage_inventories(inventory, quantity, origin, destination, event, mode="approval"):
-    if event == "purchase" and destination == "warehouse" and origin is None:
-        inventory.total_in_storage += quantity if mode == "approval" else -quantity if mode == "override" else 0
-    elif event == "purchase" and destination == "store" and origin is None:
-        inventory.total_in_shops += quantity if mode == "approval" else -quantity if mode == "override" else 0
-    elif event == "shipment" and destination == "warehouse" and origin == "store":
-        inventory.total_in_storage += quantity if mode == "approval" else -quantity if mode == "override" else 0
-        inventory.total_in_shops -= quantity if mode == "approval" else -quantity if mode == "override" else 0
-    elif event == "shipment" and destination == "store" and origin == "warehouse":
-        inventory.total_in_storage -= quantity if mode == "approval" else -quantity if mode == "override" else 0
-        inventory.total_in_shops += quantity if mode == "approval" else -quantity if mode == "override" else 0
-    elif event == "return" and origin == "warehouse" and destination is None:
-        inventory.total_in_storage -= quantity if mode == "approval" else -quantity if mode == "override" else 0
-    elif event == "return" and origin == "store" and destination is None:
-        inventory.total_in_shops -= quantity if mode == "approval" else -quantity if mode == "override" else 0
-    else:
-        raise Exception("Evento invalido revisar tipo, origen y destino")
+# Units each movement adds to (warehouse, store) per approved unit, by (event, origin, destination)
+MOVEMENT_EFFECTS = {
+    ("purchase", None, "warehouse"): (1, 0),
+    ("purchase", None, "store"): (0, 1),
+    ("shipment", "store", "warehouse"): (1, -1),
+    ("shipment", "warehouse", "store"): (-1, 1),
+    ("return", "warehouse", None): (-1, 0),
+    ("return", "store", None): (0, -1),
+}
+
+MOVEMENT_MODE_SIGNS = {"approval": 1, "override": -1, "check": 0}
 
-    inventory.save() if mode == "approval" or mode == "override" else None
 
+def movement_effect(event, origin, destination, mode="approval"):
+    """
+    Returns the (warehouse, store) units a movement moves per unit in the given
+    mode: approval applies it, override reverts it and check only validates it.
+    """
+    effect = MOVEMENT_EFFECTS.get((event, origin, destination))
+    if effect is None:
+        raise Exception("Evento invalido revisar tipo, origen y destino")
+
+    sign = MOVEMENT_MODE_SIGNS[mode]
+    return effect[0] * sign, effect[1] * sign
@@ -1,11 +1,13 @@
 import base64
 import hashlib
 import hmac
+import json
+import logging
+import threading
+import time
 import warnings
 
-import boto3
 import requests
-from botocore.config import Config
 from django.conf import settings
 from django.http import JsonResponse
 from jose import jwt
@@ -13,28 +15,20 @@ from rest_framework import status
 from rest_framework.response import Response
 from urllib3.exceptions import InsecureRequestWarning
 
+from inventory_api.aws import get_aws_client
+from inventory_api.caching import TTLCache
+
 warnings.simplefilter("ignore", InsecureRequestWarning)
 
-config = Config(
-    retries={
-        'max_attempts': 5,
-        'mode': 'adaptive'
-    },
-    connect_timeout=5,
-    read_timeout=10
-)
+logger = logging.getLogger(__name__)
 
-client = boto3.client('cognito-idp', region_name=settings.AWS_REGION_NAME,
-                      aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                      aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                      config=config)
 
-ses_client = boto3.client('ses', region_name=settings.AWS_REGION_NAME,
-                          aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
+def cognito_client():
+    return get_aws_client('cognito-idp')
 
 
 def create_cognito_user(email):
+    client = cognito_client()
     user_attributes = [
         {'Name': 'email', 'Value': email},
     ]
@@ -69,6 +63,7 @@ def calculate_secret_hash(username):
 
 
 def authenticate_user(email, password):
+    client = cognito_client()
     try:
         secret_hash = calculate_secret_hash(
             username=email
@@ -97,17 +92,93 @@ def authenticate_user(email, password):
 
 
 def get_cognito_public_keys():
-    response = requests.get(settings.COGNITO_PUBLIC_KEYS_URL, timeout=2, verify=False)
-    keys = response.json().get('keys', [])
+    if settings.COGNITO_BACKEND == 'local':
+        from .local_cognito import token_issuer
+        keys = token_issuer.jwks().get('keys', [])
+    elif settings.COGNITO_JWKS_FILE:
+        with open(settings.COGNITO_JWKS_FILE) as jwks_file:
+            keys = json.load(jwks_file).get('keys', [])
+    else:
+        response = requests.get(settings.COGNITO_PUBLIC_KEYS_URL, timeout=2, verify=False)
+        keys = response.json().get('keys', [])
     return {key['kid']: key for key in keys}
 
 
-PUBLIC_KEYS = get_cognito_public_keys()
+class CognitoKeyStore:
+    """
+    Lazily loaded JWKS cache. Keys are fetched on first use and refreshed once
+    they are older than ``ttl`` seconds. A token signed with an unknown ``kid``
+    triggers a single refresh shared by every thread waiting on it, rate limited
+    by ``min_refresh_interval`` so forged ``kid`` values can't hammer Cognito.
+    """
+
+    def __init__(self, loader=get_cognito_public_keys, ttl=None, min_refresh_interval=30):
+        self._loader = loader
+        self._ttl = ttl
+        self._min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._loaded_at = None
+        self._last_attempt = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else settings.COGNITO_JWKS_TTL
+
+    def get_key(self, kid):
+        generation = self._generation
+
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh(generation)
+            generation = self._generation
+
+        key = self._keys.get(kid)
+        if key is None and self._can_refresh():
+            self.refresh(generation)
+            key = self._keys.get(kid)
+
+        return key
+
+    def refresh(self, seen_generation=None):
+        with self._lock:
+            if seen_generation is not None and seen_generation != self._generation:
+                # Another thread refreshed the keys while this one was waiting
+                return
+
+            if self._keys and not self._can_refresh():
+                return
+
+            self._last_attempt = time.monotonic()
+            try:
+                keys = self._loader()
+            except Exception as e:
+                if not self._keys:
+                    raise
+                logger.warning("Could not refresh Cognito public keys, keeping cached keys: %s", e)
+                return
+
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._loaded_at = None
+            self._last_attempt = None
+            self._generation += 1
+
+    def _can_refresh(self):
+        return self._last_attempt is None or time.monotonic() - self._last_attempt >= self._min_refresh_interval
+
+
+key_store = CognitoKeyStore()
 
 
 def validate_token(token):
     headers = jwt.get_unverified_header(token)
-    key = PUBLIC_KEYS.get(headers['kid'])
+    key = key_store.get_key(headers['kid'])
 
     if not key:
         raise ValueError("Invalid token")
@@ -120,7 +191,30 @@ def validate_token(token):
     )
 
 
+verified_claims = TTLCache(maxsize=settings.VERIFIED_CLAIMS_CACHE_SIZE)
+
+
+def get_verified_claims(token):
+    """
+    Same as validate_token but memoizes the verified claims per process until
+    the token expires, so a terminal reusing its access token skips RS256
+    verification. Entries are keyed by a hash of the token, never the token.
+    """
+    if not token:
+        return validate_token(token)
+
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    claims = verified_claims.get(cache_key)
+
+    if claims is None:
+        claims = validate_token(token)
+        verified_claims.set(cache_key, claims, expires_at=claims.get('exp', 0))
+
+    return dict(claims)
+
+
 def handle_new_password_required(email, new_password, session):
+    client = cognito_client()
     try:
         secret_hash = calculate_secret_hash(
             username=email
@@ -145,6 +239,7 @@ def handle_new_password_required(email, new_password, session):
 
 
 def handle_password_update(access_token, old_password, new_password):
+    client = cognito_client()
     try:
         client.change_password(
             AccessToken=access_token,
@@ -168,6 +263,7 @@ def handle_password_update(access_token, old_password, new_password):
 
 
 def forgot_password(email):
+    client = cognito_client()
     try:
         secret_hash = calculate_secret_hash(
             username=email
@@ -185,6 +281,7 @@ def forgot_password(email):
 
 
 def confirm_forgot_password(email, confirmation_code, new_password):
+    client = cognito_client()
     try:
         secret_hash = calculate_secret_hash(
             username=email
@@ -208,6 +305,7 @@ def confirm_forgot_password(email, confirmation_code, new_password):
 
 
 def verify_email_send(token):
+    client = cognito_client()
     client.get_user_attribute_verification_code(
         AccessToken=token,
         AttributeName='email'
@@ -216,6 +314,7 @@ def verify_email_send(token):
 
 
 def verify_email(token, code):
+    client = cognito_client()
     client.verify_user_attribute(
         AccessToken=token,
         AttributeName='email',
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from jose import jwk, jwt
+
+from inventory_api.aws_stub import StubCognitoClient
+
+
+class LocalTokenIssuer:
+    """
+    Signs Cognito shaped RS256 access tokens with a local key pair and publishes
+    the matching JWKS. The private key is stored in LOCAL_COGNITO_KEY_FILE so every
+    worker process of the same host signs and verifies with the same key; a key
+    file that is a link, or that other users own or can read, is refused.
+    """
+
+    def __init__(self, key_file=None):
+        self._key_file = key_file
+        self._private_pem = None
+        self._public_pem = None
+        self._kid = None
+        self._lock = threading.Lock()
+
+    @property
+    def key_file(self):
+        key_file = self._key_file or settings.LOCAL_COGNITO_KEY_FILE
+        if not key_file:
+            raise Exception("Debe configurar LOCAL_COGNITO_KEY_FILE para usar COGNITO_BACKEND = local")
+        return key_file
+
+    @property
+    def issuer(self):
+        return f"https://cognito-idp.local/{settings.USER_POOL_ID}"
+
+    def private_key(self):
+        if self._private_pem is None:
+            with self._lock:
+                if self._private_pem is None:
+                    private_pem = self._load_or_create_key()
+                    private_key = serialization.load_pem_private_key(private_pem, password=None)
+                    self._public_pem = private_key.public_key().public_bytes(
+                        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+                    self._kid = hashlib.sha256(self._public_pem).hexdigest()[:32]
+                    self._private_pem = private_pem
+        return self._private_pem
+
+    def public_pem(self):
+        self.private_key()
+        return self._public_pem
+
+    @property
+    def kid(self):
+        self.private_key()
+        return self._kid
+
+    def jwks(self):
+        key = jwk.construct(self.public_pem(), "RS256").to_dict()
+        key = {name: value.decode() if isinstance(value, bytes) else value for name, value in key.items()}
+        return {"keys": [{**key, "kid": self.kid, "use": "sig"}]}
+
+    def mint(self, sub, username, token_use="access", expires_in=3600):
+        now = int(time.time())
+        claims = {
+            "sub": sub,
+            "iss": self.issuer,
+            "client_id": settings.CLIENT_ID,
+            "origin_jti": str(uuid.uuid4()),
+            "event_id": str(uuid.uuid4()),
+            "token_use": token_use,
+            "scope": "aws.cognito.signin.user.admin",
+            "auth_time": now,
+            "iat": now,
+            "exp": now + expires_in,
+            "jti": str(uuid.uuid4()),
+            "username": username,
+        }
+        return jwt.encode(claims, self.private_key(), algorithm="RS256", headers={"kid": self.kid})
+
+    def verify(self, token):
+        return jwt.decode(token, self.public_pem(), algorithms=["RS256"], audience=settings.CLIENT_ID)
+
+    def _load_or_create_key(self):
+        path = self.key_file
+        try:
+            return self._read_key(path)
+        except FileNotFoundError:
+            pass
+
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+
+        # Write a new 0600 file then link it so concurrent workers never read a
+        # half written key, and keep whichever key won the race
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as key_file:
+            key_file.write(pem)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+
+        return self._read_key(path)
+
+    @staticmethod
+    def _read_key(path):
+        with os.fdopen(os.open(path, os.O_RDONLY | os.O_NOFOLLOW), "rb") as key_file:
+            info = os.fstat(key_file.fileno())
+            if info.st_uid != os.getuid() or info.st_mode & 0o077:
+                raise Exception(f"La llave {path} debe pertenecer al usuario del servidor y tener permisos 0600")
+            return key_file.read()
+
+
+token_issuer = LocalTokenIssuer()
+
+
+class LocalCognitoClient(StubCognitoClient):
+    """
+    Cognito stand-in used when COGNITO_BACKEND = "local". Users that exist in the
+    database can log in with their stored sub, and access tokens are real RS256
+    JWTs from token_issuer, so authenticate_user, login_view and
+    IsAuthenticatedCustom run their normal code paths. Database users log in
+    with LOCAL_COGNITO_PASSWORD.
+    """
+
+    def __init__(self):
+        if not settings.LOCAL_COGNITO_PASSWORD:
+            raise Exception("Debe configurar LOCAL_COGNITO_PASSWORD para usar COGNITO_BACKEND = local")
+        super().__init__()
+
+    def _get_user(self, username):
+        user = self.users.get(username)
+        if user is None:
+            from user_control.models import CustomUser
+
+            db_user = CustomUser.objects.filter(email=username).values("sub").first()
+            if db_user is None:
+                raise self.exceptions.UserNotFoundException(f"User {username} does not exist")
+
+            user = self.users.setdefault(username, {
+                "username": username,
+                "attributes": {"email": username, "sub": db_user["sub"] or str(uuid.uuid4())},
+                "password": settings.LOCAL_COGNITO_PASSWORD,
+                "status": "CONFIRMED"
+            })
+        return user
+
+    def _issue_tokens(self, user):
+        return {
+            "AccessToken": token_issuer.mint(user["attributes"]["sub"], user["username"]),
+            "IdToken": token_issuer.mint(user["attributes"]["sub"], user["username"], token_use="id"),
+            "RefreshToken": str(uuid.uuid4()),
+            "ExpiresIn": 3600,
+            "TokenType": "Bearer"
+        }
+
+    def _user_from_token(self, access_token):
+        try:
+            claims = token_issuer.verify(access_token)
+        except Exception:
+            raise self.exceptions.NotAuthorizedException("Invalid Access Token")
+        return self._get_user(claims["username"])
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_control', '0011_customuser_is_verified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='sub',
+            field=models.CharField(db_index=True, max_length=255, null=True),
+        ),
+    ]
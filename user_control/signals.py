@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from inventory_api.custom_methods import invalidate_user_cache
+from .models import CustomUser, Company
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Dropped on commit, before that a concurrent request could cache the old row again
+    sub = instance.sub
+    transaction.on_commit(lambda: invalidate_user_cache(sub=sub))
+
+
+@receiver([post_save, post_delete], sender=Company)
+def invalidate_cached_company_users(sender, instance, **kwargs):
+    company_id = instance.id
+    transaction.on_commit(lambda: invalidate_user_cache(company_id=company_id))
@@ -26,6 +26,18 @@ def add_user_activity(user, action):
     )
 
 
+def add_user_activities(user, actions):
+    UserActivities.objects.bulk_create([
+        UserActivities(
+            user_id=user.id,
+            email=user.email,
+            fullname=user.fullname,
+            company_id=user.company_id,
+            action=action
+        ) for action in actions
+    ])
+
+
 def add_user_activity_from_email(email, action):
     user = CustomUser.objects.all().filter(email=email).first()
     user.last_login = datetime.now()